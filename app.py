@@ -1,18 +1,83 @@
 #!flask/bin/python
-from data_provider import MoveDAO, GameDAO
-from flask import Blueprint, Flask, jsonify, request
+from data_provider import MoveDAO, GameDAO, GameDoneError, GameExistsError
+from flask import Blueprint, Flask, jsonify, request, Response
 from flask_restful import abort, Api, Resource
+from game_ids import encode_game_id, generate_game_id, normalize_game_id
+from game_reaper import GameReaper
+from itertools import chain
+from journaled_data_provider import JournaledDataProvider
+from json import dumps
+from replicated_data_provider import ReplicatedDataProvider
+from sharded_data_provider import ShardedDataProvider
 from sql_data_provider import SQLAlchemyDataProvider
-from uuid import uuid4
+from werkzeug.routing import BaseConverter
 
 flask_app = Flask(__name__)
 flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://localhost/9dt'
 flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-data_provider = SQLAlchemyDataProvider(flask_app)
+# Shard name to database URI, e.g. {'shard0': 'postgresql://db0/9dt', 'shard1': 'postgresql://db1/9dt'}.
+# When empty all games are stored in the SQLALCHEMY_DATABASE_URI database.
+flask_app.config['SHARD_DATABASE_URIS'] = {}
+# Read replicas of the SQLALCHEMY_DATABASE_URI database, e.g. ['postgresql://replica0/9dt'].
+flask_app.config['REPLICA_DATABASE_URIS'] = []
+# Journal file moves are written to before being persisted to the SQLALCHEMY_DATABASE_URI database in the background.
+# When None moves are committed to the database before the response is sent.
+flask_app.config['MOVE_JOURNAL_PATH'] = None
+# Time after which an in-progress game without moves is finished as a draw. When None games are only finished by running
+# reap_games.py.
+flask_app.config['GAME_REAPER_TTL_SECONDS'] = None
+# Only one of these can be set, as sharding, read replicas and the move journal can not be combined.
+EXCLUSIVE_CONFIG_KEYS = ['SHARD_DATABASE_URIS', 'REPLICA_DATABASE_URIS', 'MOVE_JOURNAL_PATH']
+
+
+def create_data_provider(app):
+    """
+    Creates the data provider for the databases set in the app's config.
+
+    The move journal and background threads are added by start_server. Raises a ValueError when more than one of
+    EXCLUSIVE_CONFIG_KEYS is set, rather than silently ignoring all but one.
+    """
+    set_keys = [key for key in EXCLUSIVE_CONFIG_KEYS if app.config[key]]
+    if len(set_keys) > 1:
+        raise ValueError('Only one of {} can be set, but {} are set.'.format(', '.join(EXCLUSIVE_CONFIG_KEYS),
+                                                                            ' and '.join(set_keys)))
+    if app.config['SHARD_DATABASE_URIS']:
+        return ShardedDataProvider.from_database_uris(app.config['SHARD_DATABASE_URIS'])
+    elif app.config['REPLICA_DATABASE_URIS']:
+        return ReplicatedDataProvider.from_database_uris(SQLAlchemyDataProvider(app),
+                                                         app.config['REPLICA_DATABASE_URIS'])
+    return SQLAlchemyDataProvider(app)
+
+
+def start_server():
+    """
+    Adds the move journal to the data provider, if set, and starts the background threads before serving requests.
+
+    The journal is locked by the server process and replayed into the database when opened, so this is not done when
+    the module is imported; scripts importing the data provider (e.g. reap_games.py) use the database directly.
+    """
+    global data_provider
+    if flask_app.config['MOVE_JOURNAL_PATH']:
+        data_provider = JournaledDataProvider(data_provider, flask_app.config['MOVE_JOURNAL_PATH'])
+    if isinstance(data_provider, ReplicatedDataProvider):
+        data_provider.start_lag_monitor()
+    if flask_app.config['GAME_REAPER_TTL_SECONDS']:
+        GameReaper(data_provider, flask_app.config['GAME_REAPER_TTL_SECONDS']).start()
+
+
+data_provider = create_data_provider(flask_app)
 api_blueprint = Blueprint('drop_token_api', __name__)
 api = Api(api_blueprint)
 
 MOVE_DIRECTIONS = (1, 0), (0, 1), (1, 1), (-1, 0), (0, -1), (-1, 1), (1, -1), (-1, -1)
+CREATE_GAME_ATTEMPTS = 3
+# NDJSON line templates per move type, matching the get_move_output format; filled with the JSON encoded player ID and
+# the column. The export templates are additionally filled with the JSON encoded game ID first.
+NDJSON_MOVE_TEMPLATES = {MoveDAO.TYPE_MOVE: '{{"column": {1}, "player": {0}, "type": "MOVE"}}\n',
+                         MoveDAO.TYPE_QUIT: '{{"player": {0}, "type": "QUIT"}}\n'}
+NDJSON_EXPORT_MOVE_TEMPLATES = {MoveDAO.TYPE_MOVE: '{{"column": {2}, "gameId": {0}, "player": {1}, "type": "MOVE"}}\n',
+                                MoveDAO.TYPE_QUIT: '{{"gameId": {0}, "player": {1}, "type": "QUIT"}}\n'}
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 
 ###
@@ -35,8 +100,15 @@ class GameStateAPI(Resource):
         rows = request.json.get('rows')
         if type(rows) is not int or rows <= 0:
             abort(400, message='columns argument missing or invalid.')
-        game_id = str(uuid4())
-        data_provider.create_game(game_id, columns, rows, players)
+        # IDs generated in the same millisecond by different processes can collide, so retry with a new ID.
+        for attempt in range(CREATE_GAME_ATTEMPTS):
+            game_id = encode_game_id(generate_game_id())
+            try:
+                data_provider.create_game(game_id, columns, rows, players)
+                break
+            except GameExistsError:
+                if attempt == CREATE_GAME_ATTEMPTS - 1:
+                    raise
         return jsonify({'gameId': game_id})
 
 
@@ -61,7 +133,7 @@ class MoveAPI(Resource):
     def get(self, game_id, move_number_unicode):
         """ Return a move. """
         move_number = parse_argument_as_number(move_number_unicode)
-        game = get_game_by_id(game_id, active_only=False)
+        game = get_game_by_id(game_id, active_only=False, min_move_count=move_number + 1)
         if move_number < 0 or move_number >= len(game.moves):
             abort(404, message='Move not found.')
         return jsonify(get_move_output(game.moves[move_number]))
@@ -94,6 +166,29 @@ class MoveListAPI(Resource):
         return jsonify({'moves': moves_list})
 
 
+class MoveStreamAPI(Resource):
+    """ Handles streaming all the moves of a given game as NDJSON. """
+    def get(self, game_id):
+        """ Stream the moves played, one JSON object per line. """
+        rows = iter(data_provider.get_move_rows([game_id]))
+        # Read the first row before responding, so a missing game can still be answered with a 404.
+        first_row = next(rows, None)
+        if not first_row:
+            abort(404, message='Game not found')
+        return Response(generate_ndjson_moves(first_row, rows), mimetype=NDJSON_MIMETYPE)
+
+
+class MoveExportAPI(Resource):
+    """ Handles streaming the moves of multiple games as NDJSON. """
+    def get(self):
+        """ Stream the moves played in the games given by the comma separated gameIds argument. """
+        game_ids_arg = request.args.get('gameIds')
+        if not game_ids_arg:
+            abort(400, message='gameIds argument missing or invalid.')
+        rows = data_provider.get_move_rows([normalize_game_id(game_id) for game_id in game_ids_arg.split(',')])
+        return Response(generate_ndjson_export_moves(rows), mimetype=NDJSON_MIMETYPE)
+
+
 class PlayerMoveAPI(Resource):
     """ Handles the moves made by a player; such as making a move or quiting the game. """
     def post(self, game_id, player_id):
@@ -121,7 +216,7 @@ class PlayerMoveAPI(Resource):
             game.state = GameDAO.GAME_STATE_DONE
         elif is_game_draw(game):
             game.state = GameDAO.GAME_STATE_DONE
-        data_provider.persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_MOVE, column=move_column)
+        persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_MOVE, column=move_column)
         return jsonify({'move': '{}/moves/{}'.format(game_id, move_number)})
 
     def delete(self, game_id, player_id):
@@ -136,7 +231,7 @@ class PlayerMoveAPI(Resource):
         if len(game.active_players_list) is 1:
             game.state = GameDAO.GAME_STATE_DONE
             game.winner = game.active_players_list[0]
-        data_provider.persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_QUIT)
+        persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_QUIT)
         return {}, 202
 
 
@@ -152,9 +247,28 @@ def get_move_output(move):
     return result
 
 
-def get_game_by_id(game_id, player_id=None, active_only=True, serialize_players=False):
+def generate_ndjson_moves(first_row, rows):
+    """ Generates the NDJSON lines of a single game's move rows, the first of which has already been read. """
+    for row in chain([first_row], rows):
+        if row[2] is not None:
+            yield NDJSON_MOVE_TEMPLATES[row[2]].format(dumps(row[1]), row[3])
+
+
+def generate_ndjson_export_moves(rows):
+    """ Generates the NDJSON lines of multiple games' move rows. """
+    encoded_game_id, last_game_id = None, None
+    for row in rows:
+        if row[2] is None:
+            continue
+        if row[0] != last_game_id:
+            encoded_game_id, last_game_id = dumps(row[0]), row[0]
+        yield NDJSON_EXPORT_MOVE_TEMPLATES[row[2]].format(encoded_game_id, dumps(row[1]), row[3])
+
+
+def get_game_by_id(game_id, player_id=None, active_only=True, serialize_players=False, min_move_count=0):
     """ Retrieves the game from the data_provider, and validates whether the provided parameter criteria is met. """
-    game = data_provider.get_game_by_id(game_id, player_id=player_id, serialize_players=serialize_players)
+    game = data_provider.get_game_by_id(game_id, player_id=player_id, serialize_players=serialize_players,
+                                        min_move_count=min_move_count)
     if not game:
         abort(404, message='Game not found')
     if game.state is GameDAO.GAME_STATE_DONE and active_only:
@@ -172,6 +286,14 @@ def get_game_for_player_with_board(game_id, player_id):
     return game
 
 
+def persist_new_move_and_game_state(game, player_id, move_type, column=None):
+    """ Persists the move with the data_provider, rejecting it if the game was finished since it was read. """
+    try:
+        data_provider.persist_new_move_and_game_state(game, player_id, move_type, column=column)
+    except GameDoneError:
+        abort(410, message='Game is already in DONE state.')
+
+
 def is_game_draw(game):
     """ Determines whether the game, in its current state, is a draw. """
     total_moves = game.columns * game.rows
@@ -202,15 +324,25 @@ def parse_argument_as_number(argument):
     except ValueError:
         abort(400, message='Malformed request')
 
+class GameIdConverter(BaseConverter):
+    """ Converts game IDs in URLs to the form they are stored in, so e.g. uppercased compact IDs are found. """
+    def to_python(self, value):
+        return normalize_game_id(value)
+
+
 ##
 # Setup the Api resource routing
 ##
+flask_app.url_map.converters['game_id'] = GameIdConverter
 api.add_resource(GameStateAPI, '/drop_token')
-api.add_resource(GameStateByIdAPI, '/drop_token/<game_id>')
-api.add_resource(PlayerMoveAPI, '/drop_token/<game_id>/<player_id>')
-api.add_resource(MoveAPI, '/drop_token/<game_id>/moves/<move_number_unicode>')
-api.add_resource(MoveListAPI, '/drop_token/<game_id>/moves')
+api.add_resource(MoveExportAPI, '/drop_token/moves.ndjson')
+api.add_resource(GameStateByIdAPI, '/drop_token/<game_id:game_id>')
+api.add_resource(PlayerMoveAPI, '/drop_token/<game_id:game_id>/<player_id>')
+api.add_resource(MoveAPI, '/drop_token/<game_id:game_id>/moves/<move_number_unicode>')
+api.add_resource(MoveListAPI, '/drop_token/<game_id:game_id>/moves')
+api.add_resource(MoveStreamAPI, '/drop_token/<game_id:game_id>/moves.ndjson')
 flask_app.register_blueprint(api_blueprint)
 
 if __name__ == '__main__':
+    start_server()
     flask_app.run()
@@ -0,0 +1,70 @@
+from argparse import ArgumentParser
+from data_provider import MoveDAO
+from journaled_data_provider import JournaledDataProvider
+from os import path
+from shutil import rmtree
+from sql_data_provider import create_database_app, db, SQLAlchemyDataProvider
+from tempfile import mkdtemp
+from threading import Thread
+from time import time
+
+PLAYERS = ['player1', 'player2']
+
+
+def create_sql_data_provider(database_uri):
+    """ Creates a SQLAlchemyDataProvider for the given database, with empty tables. """
+    sql_data_provider = SQLAlchemyDataProvider(create_database_app(database_uri))
+    with sql_data_provider.app.app_context():
+        db.drop_all()
+        db.create_all()
+    return sql_data_provider
+
+
+def play_moves(data_provider, game_ids, move_count):
+    """ Plays moves round robin across the given games, reading each game before moving as the API does. """
+    for move_index in range(move_count):
+        game_id = game_ids[move_index % len(game_ids)]
+        game = data_provider.get_game_by_id(game_id, serialize_players=True)
+        data_provider.persist_new_move_and_game_state(game, PLAYERS[move_index % len(PLAYERS)], MoveDAO.TYPE_MOVE,
+                                                      column=move_index % 4)
+
+
+def measure_moves_per_second(data_provider, threads, games_per_thread, moves_per_thread):
+    """ Provides the rate moves are played at by the given number of concurrent threads, each with its own games. """
+    thread_game_ids = [['game_{}_{}'.format(thread_index, game_index) for game_index in range(games_per_thread)]
+                       for thread_index in range(threads)]
+    for game_ids in thread_game_ids:
+        for game_id in game_ids:
+            data_provider.create_game(game_id, 4, 4, PLAYERS)
+    player_threads = [Thread(target=play_moves, args=(data_provider, game_ids, moves_per_thread))
+                      for game_ids in thread_game_ids]
+    start_time = time()
+    for player_thread in player_threads:
+        player_thread.start()
+    for player_thread in player_threads:
+        player_thread.join()
+    if isinstance(data_provider, JournaledDataProvider):
+        # Include the time taken to persist every journaled move.
+        data_provider.close()
+    return threads * moves_per_thread / (time() - start_time)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Compares the moves per second of synchronous and journaled move writes.')
+    parser.add_argument('--database-uri', help='The database to benchmark against, defaults to a temporary SQLite DB.')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--games-per-thread', type=int, default=4)
+    parser.add_argument('--moves-per-thread', type=int, default=200)
+    args = parser.parse_args()
+    benchmark_dir = mkdtemp()
+    try:
+        database_uri = args.database_uri or 'sqlite:///{}'.format(path.join(benchmark_dir, 'benchmark.db'))
+        for mode in 'synchronous', 'journaled':
+            data_provider = create_sql_data_provider(database_uri)
+            if mode == 'journaled':
+                data_provider = JournaledDataProvider(data_provider, path.join(benchmark_dir, 'benchmark.journal'))
+            moves_per_second = measure_moves_per_second(data_provider, args.threads, args.games_per_thread,
+                                                        args.moves_per_thread)
+            print('{}: {:.0f} moves/sec'.format(mode, moves_per_second))
+    finally:
+        rmtree(benchmark_dir)
@@ -31,6 +31,16 @@ class GameDAO(object):
         self.board = board
 
 
+class GameExistsError(Exception):
+    """ Raised when a game is created with an ID that is already in use. """
+    pass
+
+
+class GameDoneError(Exception):
+    """ Raised when a move is persisted to a game that has been finished since it was read, e.g. by the game reaper. """
+    pass
+
+
 class DataProviderInterface(Interface):
     """ Defines the interface for accessing application data. All implementations must return DAO objects. """
     def get_all_active_game_ids(self):
@@ -59,10 +69,16 @@ class DataProviderInterface(Interface):
             The number of rows in game's board.
         players : list
             A list of the initial player IDs.
+
+        Raises
+        ------
+        GameExistsError
+            If a game with the given ID already exists.
+
         """
         pass
 
-    def get_game_by_id(self, game_id, player_id=None, serialize_players=False):
+    def get_game_by_id(self, game_id, player_id=None, serialize_players=False, min_move_count=0):
         """
         Provides the GameDAO object for the given ID.
 
@@ -74,6 +90,9 @@ class DataProviderInterface(Interface):
             Optional parameter, indicating whether the game's active players should include the provided player ID.
         serialize_players : bool
             Whether or not the game's active and initial list of players should be included in the result.
+        min_move_count : int
+            Optional parameter, the number of moves the client knows the game to have. Implementations reading from
+            copies that may lag behind (e.g. read replicas) must not return a game with fewer moves.
 
         Returns
         -------
@@ -98,5 +117,49 @@ class DataProviderInterface(Interface):
         column : int
             Optional parameter for a MoveDAO.TYPE_MOVE move that indicates which column the move was played in.
 
+        Raises
+        ------
+        GameDoneError
+            If the stored game is no longer in progress. Implementations persisting moves in the background skip the
+            move instead.
+
+        """
+        pass
+
+    def get_move_rows(self, game_ids):
+        """
+        Provides the moves of the given games as plain rows, read lazily so they never all have to be held in memory.
+
+        Parameters
+        ----------
+        game_ids : list
+            The IDs of the games to provide the moves of.
+
+        Returns
+        -------
+        iterator
+            (game_id, player_id, move_type, column) tuples, grouped by game and in the order the moves were played.
+            A game without moves provides a single row with None player_id, move_type and column; games that are not
+            found provide no rows.
+
+        """
+        pass
+
+    def expire_inactive_games(self, inactive_since, max_games):
+        """
+        Finishes in-progress games that have had no moves since the given time, as a draw.
+
+        Parameters
+        ----------
+        inactive_since : datetime
+            The UTC time games must have been inactive since to be expired.
+        max_games : int
+            The maximum number of games to expire, bounding the time the games are locked for.
+
+        Returns
+        -------
+        int
+            The number of games expired.
+
         """
         pass
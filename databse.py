@@ -1,7 +1,13 @@
-from app import flask_app
+from app import data_provider, flask_app
+from sharded_data_provider import ShardedDataProvider
 from sql_data_provider import db
 
 if __name__ == '__main__':
-    with flask_app.app_context():
-        db.drop_all()
-        db.create_all()
+    if isinstance(data_provider, ShardedDataProvider):
+        apps = [shard.app for shard in data_provider.shards.values()]
+    else:
+        apps = [flask_app]
+    for app in apps:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
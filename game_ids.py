@@ -0,0 +1,67 @@
+from binascii import hexlify
+from os import urandom
+from time import time
+
+# Crockford's base32 alphabet; lowercase so IDs read well in URLs.
+ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+# Letters decoded as the digits they are easily mistaken for, as Crockford's base32 specifies.
+DECODE_ALIASES = {'i': '1', 'l': '1', 'o': '0'}
+ENCODED_LENGTH = 13
+EPOCH_MILLISECONDS = 1514764800000  # 2018-01-01T00:00:00Z
+RANDOM_BITS = 22
+# IDs are kept below 2^63 so they fit a signed BIGINT column.
+MAX_GAME_ID = (1 << 63) - 1
+
+
+def generate_game_id(timestamp=None):
+    """
+    Generates a 63 bit game ID, made up of the milliseconds since 2018 followed by 22 random bits.
+
+    IDs generated later sort after earlier ones, so new games are inserted at the end of the game and move indexes.
+
+    Parameters
+    ----------
+    timestamp : float
+        Optional parameter, the UNIX time to generate the ID for instead of the current time.
+
+    Returns
+    -------
+    int
+        The game ID.
+
+    """
+    milliseconds = int((time() if timestamp is None else timestamp) * 1000) - EPOCH_MILLISECONDS
+    random_bits = int(hexlify(urandom((RANDOM_BITS + 7) // 8)), 16) >> (-RANDOM_BITS % 8)
+    return (max(milliseconds, 0) << RANDOM_BITS) | random_bits
+
+
+def encode_game_id(game_id):
+    """ Encodes a game ID as a fixed length base32 string, which sorts in the same order as the ID. """
+    characters = []
+    for _ in range(ENCODED_LENGTH):
+        characters.append(ALPHABET[game_id & 31])
+        game_id >>= 5
+    return ''.join(reversed(characters))
+
+
+def decode_game_id(encoded_game_id):
+    """
+    Decodes a string created by encode_game_id, returning None for any other string (e.g. a legacy UUID).
+
+    Decoding is case insensitive, and decodes 'i' and 'l' as '1' and 'o' as '0'.
+    """
+    if len(encoded_game_id) != ENCODED_LENGTH:
+        return None
+    game_id = 0
+    for character in encoded_game_id.lower():
+        index = ALPHABET.find(DECODE_ALIASES.get(character, character))
+        if index < 0:
+            return None
+        game_id = (game_id << 5) | index
+    return game_id if game_id <= MAX_GAME_ID else None
+
+
+def normalize_game_id(game_id):
+    """ Provides the form encode_game_id creates of a compact game ID written differently, and any other ID as is. """
+    compact_id = decode_game_id(game_id)
+    return game_id if compact_id is None else encode_game_id(compact_id)
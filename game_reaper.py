@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from logging import getLogger
+from threading import Event, Thread
+from time import sleep
+
+logger = getLogger(__name__)
+
+
+class GameReaper(object):
+    """ Finishes in-progress games that have had no moves for longer than a time to live, in small batches. """
+    def __init__(self, data_provider, ttl_seconds, batch_size=100, batch_pause_seconds=0.1):
+        """
+        Parameters
+        ----------
+        data_provider : DataProviderInterface
+            The data provider the games are stored in.
+        ttl_seconds : int
+            The time since its last move after which a game is finished.
+        batch_size : int
+            The maximum number of games finished in a single commit.
+        batch_pause_seconds : float
+            The time to wait between batches, leaving the database free for live traffic.
+        """
+        self.data_provider = data_provider
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+        self.stop_event = Event()
+
+    def reap(self):
+        """
+        Finishes every game that has been inactive for longer than the time to live.
+
+        Returns
+        -------
+        int
+            The number of games finished.
+
+        """
+        inactive_since = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        reaped_count = 0
+        while not self.stop_event.is_set():
+            expired_count = self.data_provider.expire_inactive_games(inactive_since, self.batch_size)
+            if not expired_count:
+                break
+            reaped_count += expired_count
+            sleep(self.batch_pause_seconds)
+        return reaped_count
+
+    def start(self, interval_seconds=60):
+        """ Starts a background thread calling reap every interval_seconds. """
+        def reap_periodically():
+            while not self.stop_event.wait(interval_seconds):
+                try:
+                    self.reap()
+                except Exception:
+                    logger.exception('Failed to reap inactive games, retrying next interval.')
+        self.stop_event.clear()
+        reaper_thread = Thread(target=reap_periodically)
+        reaper_thread.daemon = True
+        reaper_thread.start()
+
+    def stop(self):
+        """ Stops the background thread started by start, after its current batch. """
+        self.stop_event.set()
@@ -0,0 +1,233 @@
+from collections import deque
+from data_provider import DataProviderInterface
+from fcntl import flock, LOCK_EX, LOCK_NB
+from glob import glob
+from interface import implements
+from itertools import islice
+from json import dumps, loads
+from logging import getLogger
+from os import close, fsync, O_RDONLY, open as open_descriptor, path, remove
+from threading import Condition, Lock, Thread
+from time import sleep, time
+
+logger = getLogger(__name__)
+
+
+class JournaledDataProvider(implements(DataProviderInterface)):
+    """
+    A DataProviderInterface implementation that writes moves behind a SQLAlchemyDataProvider.
+
+    Each new move is appended to a local journal file and fsynced before returning, then a background thread persists
+    the queued moves to the database, committing everything queued at once (group commit). The database stores the
+    sequence of the last persisted journal entry in the same commit, so on startup any journal entries after it are
+    replayed. Reads of a game wait until its queued moves have been persisted.
+
+    The journal is written as segment files named after the journal path and the sequence of their first entry. Once a
+    segment reaches max_segment_bytes a new one is started, and segments are deleted once all of their entries have
+    been persisted. A journal is locked by the process writing to it, so each process (e.g. each web server worker)
+    must be given its own journal path.
+    """
+    def __init__(self, data_provider, journal_path, max_batch_size=500, max_segment_bytes=16 * 1024 * 1024,
+                 retry_seconds=1, max_wait_seconds=30):
+        """
+        Parameters
+        ----------
+        data_provider : SQLAlchemyDataProvider
+            The data provider the journaled moves are persisted to.
+        journal_path : str
+            The path the journal's segment and lock files are named after, whose absolute path identifies the journal
+            in the database.
+        max_batch_size : int
+            The maximum number of moves persisted in a single commit.
+        max_segment_bytes : int
+            The journal segment size after which a new segment is started.
+        retry_seconds : int
+            The time to wait before retrying to persist moves after an error.
+        max_wait_seconds : int
+            The maximum time a read waits for the game's queued moves to be persisted before failing.
+        """
+        self.data_provider = data_provider
+        self.journal_path = journal_path
+        self.journal_name = path.abspath(journal_path)
+        self.max_batch_size = max_batch_size
+        self.max_segment_bytes = max_segment_bytes
+        self.retry_seconds = retry_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.pending_entries = deque()
+        self.pending_game_counts = {}
+        # The first sequence and path of each segment, oldest first; the last one is being written to.
+        self.segments = deque()
+        # journal_lock guards appending to the journal and the segments, condition guards the pending entries.
+        self.journal_lock = Lock()
+        self.condition = Condition()
+        self.stopped = False
+        self.lock_file = open('{}.lock'.format(journal_path), 'a')
+        try:
+            flock(self.lock_file.fileno(), LOCK_EX | LOCK_NB)
+        except (IOError, OSError):
+            self.lock_file.close()
+            raise RuntimeError('Journal {} is already in use by another process.'.format(journal_path))
+        self.last_sequence = self.recover()
+        self.journal_file = self.start_segment(self.last_sequence + 1)
+        self.flush_thread = Thread(target=self.flush_pending_entries)
+        self.flush_thread.daemon = True
+        self.flush_thread.start()
+
+    def get_all_active_game_ids(self):
+        return self.data_provider.get_all_active_game_ids()
+
+    def create_game(self, game_id, columns, rows, players):
+        self.data_provider.create_game(game_id, columns, rows, players)
+
+    def get_game_by_id(self, game_id, player_id=None, serialize_players=False, min_move_count=0):
+        self.wait_for_pending_entries([game_id])
+        return self.data_provider.get_game_by_id(game_id, player_id=player_id, serialize_players=serialize_players,
+                                                 min_move_count=min_move_count)
+
+    def get_game_for_player_with_board(self, game_id, player_id):
+        self.wait_for_pending_entries([game_id])
+        return self.data_provider.get_game_for_player_with_board(game_id, player_id)
+
+    def persist_new_move_and_game_state(self, game_dao, player_id, move_type, column=None):
+        entry = {'game_id': game_dao.id, 'player_id': player_id, 'move_type': move_type, 'column': column,
+                 'active_players': game_dao.active_players_list,
+                 'current_active_player_index': game_dao.current_active_player_index,
+                 'winner': game_dao.winner, 'state': game_dao.state, 'timestamp': time()}
+        with self.journal_lock:
+            self.last_sequence += 1
+            entry['sequence'] = self.last_sequence
+            self.journal_file.write((dumps(entry) + '\n').encode('utf-8'))
+            self.journal_file.flush()
+            fsync(self.journal_file.fileno())
+            if self.journal_file.tell() >= self.max_segment_bytes:
+                self.journal_file.close()
+                self.journal_file = self.start_segment(self.last_sequence + 1)
+            # Queued while holding journal_lock, so entries are persisted in sequence order.
+            with self.condition:
+                self.pending_entries.append(entry)
+                self.pending_game_counts[game_dao.id] = self.pending_game_counts.get(game_dao.id, 0) + 1
+                self.condition.notify_all()
+
+    def get_move_rows(self, game_ids):
+        self.wait_for_pending_entries(game_ids)
+        return self.data_provider.get_move_rows(game_ids)
+
+    def expire_inactive_games(self, inactive_since, max_games):
+        # The queued moves of a game expired before they are persisted are skipped by persist_journal_entries.
+        return self.data_provider.expire_inactive_games(inactive_since, max_games)
+
+    def wait_for_pending_entries(self, game_ids):
+        """ Waits until every queued move of the given games has been persisted, for up to max_wait_seconds. """
+        wait_until = time() + self.max_wait_seconds
+        with self.condition:
+            while any(game_id in self.pending_game_counts for game_id in game_ids):
+                if not self.flush_thread.is_alive():
+                    raise RuntimeError('Journaled moves are no longer being persisted.')
+                if time() >= wait_until:
+                    raise RuntimeError('Timed out waiting for journaled moves to be persisted.')
+                self.condition.wait(min(1, max(wait_until - time(), 0)))
+
+    def flush_pending_entries(self):
+        """ Persists queued moves until close is called, run by the background thread. """
+        while True:
+            with self.condition:
+                while not self.pending_entries and not self.stopped:
+                    self.condition.wait()
+                if not self.pending_entries:
+                    return
+                entries = list(islice(self.pending_entries, self.max_batch_size))
+            try:
+                self.data_provider.persist_journal_entries(self.journal_name, entries)
+            except Exception:
+                # Entries are kept until they are persisted, as they have already been acknowledged.
+                logger.exception('Failed to persist %d journaled moves, retrying.', len(entries))
+                sleep(self.retry_seconds)
+                continue
+            self.remove_persisted_segments(entries[-1]['sequence'])
+            with self.condition:
+                for entry in entries:
+                    self.pending_entries.popleft()
+                    self.pending_game_counts[entry['game_id']] -= 1
+                    if not self.pending_game_counts[entry['game_id']]:
+                        del self.pending_game_counts[entry['game_id']]
+                self.condition.notify_all()
+
+    def start_segment(self, first_sequence):
+        """ Creates the journal segment starting at first_sequence, and provides it opened for appending. """
+        segment_path = get_segment_path(self.journal_path, first_sequence)
+        segment_file = open(segment_path, 'ab')
+        fsync_directory(segment_path)
+        self.segments.append((first_sequence, segment_path))
+        return segment_file
+
+    def remove_persisted_segments(self, last_persisted_sequence):
+        """ Deletes the segments before the one being written to whose entries have all been persisted. """
+        with self.journal_lock:
+            persisted_paths = []
+            # A segment's last entry is the one before the first entry of the next segment.
+            while len(self.segments) > 1 and self.segments[1][0] <= last_persisted_sequence + 1:
+                persisted_paths.append(self.segments.popleft()[1])
+        for segment_path in persisted_paths:
+            remove(segment_path)
+
+    def recover(self):
+        """
+        Persists any journal entries after the database's checkpoint, e.g. those queued when the process crashed.
+
+        Returns
+        -------
+        int
+            The sequence of the last journal entry.
+
+        """
+        last_sequence = self.data_provider.get_journal_checkpoint(self.journal_name)
+        segment_paths = get_segment_paths(self.journal_path)
+        entries = []
+        for segment_path in segment_paths:
+            with open(segment_path, 'rb') as segment_file:
+                for line in segment_file:
+                    try:
+                        entry = loads(line.decode('utf-8'))
+                    except ValueError:
+                        # A partially written final entry was never acknowledged to the client.
+                        break
+                    if entry['sequence'] > last_sequence:
+                        entries.append(entry)
+        for start in range(0, len(entries), self.max_batch_size):
+            self.data_provider.persist_journal_entries(self.journal_name, entries[start:start + self.max_batch_size])
+        if entries:
+            last_sequence = entries[-1]['sequence']
+        # Every entry has now been persisted, so the journal can start out with a new empty segment.
+        for segment_path in segment_paths:
+            remove(segment_path)
+        return last_sequence
+
+    def close(self):
+        """ Persists all queued moves, then stops the background thread and closes the journal. """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.flush_thread.join()
+        self.journal_file.close()
+        self.lock_file.close()
+
+
+def get_segment_path(journal_path, first_sequence):
+    """ Provides the path of the journal segment whose first entry has the given sequence. """
+    return '{}.{:012d}'.format(journal_path, first_sequence)
+
+
+def get_segment_paths(journal_path):
+    """ Provides the paths of the journal's existing segments, oldest first. """
+    segment_paths = [segment_path for segment_path in glob('{}.*'.format(journal_path))
+                     if segment_path.rsplit('.', 1)[1].isdigit()]
+    return sorted(segment_paths, key=lambda segment_path: int(segment_path.rsplit('.', 1)[1]))
+
+
+def fsync_directory(file_path):
+    """ Fsyncs the directory containing file_path, so a file created or deleted in it survives a crash. """
+    directory_descriptor = open_descriptor(path.dirname(path.abspath(file_path)), O_RDONLY)
+    try:
+        fsync(directory_descriptor)
+    finally:
+        close(directory_descriptor)
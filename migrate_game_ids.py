@@ -0,0 +1,98 @@
+from argparse import ArgumentParser
+from calendar import timegm
+from datetime import datetime
+from game_ids import generate_game_id
+from sql_data_provider import create_database_app, db, Game, Move
+from sqlalchemy import create_engine, MetaData, Table
+from time import time
+
+
+def migrate_legacy_games(legacy_engine, database_app, batch_size=500):
+    """
+    Copies the games and moves of a database created before compact game IDs into a database with the current tables.
+
+    Each game is given a compact ID generated from the time of its first move, so migrated games stay in roughly the
+    order they were played, and keeps its original ID as its legacy ID so existing links keep working. Games without
+    moves are given IDs one millisecond apart from the start of the migration, in legacy ID order, so they do not
+    collide. Games that have already been migrated are skipped, so an interrupted migration can safely be run again.
+
+    Parameters
+    ----------
+    legacy_engine : Engine
+        The SQLAlchemy engine of the database with string game IDs.
+    database_app : Flask
+        The app of the database with compact game IDs, whose tables must already have been created.
+    batch_size : int
+        The number of games copied in each commit.
+
+    Returns
+    -------
+    int
+        The number of games migrated.
+
+    """
+    metadata = MetaData()
+    legacy_game = Table('game', metadata, autoload_with=legacy_engine)
+    legacy_move = Table('move', metadata, autoload_with=legacy_engine)
+    migrated_count, last_legacy_id, row_number, started_at = 0, '', 0, time()
+    with legacy_engine.connect() as connection:
+        while True:
+            result = connection.execute(legacy_game.select().where(legacy_game.c.id > last_legacy_id)
+                                        .order_by(legacy_game.c.id).limit(batch_size))
+            games = [dict(zip(result.keys(), row)) for row in result]
+            if not games:
+                return migrated_count
+            last_legacy_id = games[-1]['id']
+            result = connection.execute(legacy_move.select()
+                                        .where(legacy_move.c.game_id.in_([game['id'] for game in games]))
+                                        .order_by(legacy_move.c.id))
+            game_moves = {}
+            for row in result:
+                move = dict(zip(result.keys(), row))
+                game_moves.setdefault(move['game_id'], []).append(move)
+            with database_app.app_context():
+                migrated_legacy_ids = set(legacy_id for legacy_id, in db.session.query(Game.legacy_id)
+                                          .filter(Game.legacy_id.in_([game['id'] for game in games])).all())
+                for game in games:
+                    row_number += 1
+                    if game['id'] in migrated_legacy_ids:
+                        continue
+                    moves = game_moves.get(game['id'], [])
+                    db.session.add(create_migrated_game(game, moves, started_at + row_number / 1000.0))
+                    migrated_count += 1
+                db.session.commit()
+
+
+def create_migrated_game(legacy_game, legacy_moves, empty_game_timestamp):
+    """
+    Creates the Game model, with its moves, for a game and its moves read from the legacy tables.
+
+    The ID is generated from the time of the first move, or from empty_game_timestamp for a game without moves.
+    """
+    if legacy_moves:
+        first_activity = legacy_moves[0]['pub_date']
+        timestamp = timegm(first_activity.utctimetuple()) + first_activity.microsecond / 1e6
+        last_activity = legacy_moves[-1]['pub_date']
+    else:
+        timestamp, last_activity = empty_game_timestamp, datetime.utcnow()
+    game = Game(id=generate_game_id(timestamp),
+                legacy_id=legacy_game['id'], columns=legacy_game['columns'], rows=legacy_game['rows'],
+                initial_players=legacy_game['initial_players'], active_players=legacy_game['active_players'],
+                current_active_player_index=legacy_game['current_active_player_index'], state=legacy_game['state'],
+                winner=legacy_game['winner'], last_activity=legacy_game.get('last_activity') or last_activity)
+    game.moves = [Move(player_id=move['player_id'], pub_date=move['pub_date'], move_type=move['move_type'],
+                       column=move['column']) for move in legacy_moves]
+    return game
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Copies games with string IDs into a database with compact game IDs.')
+    parser.add_argument('legacy_database_uri',
+                        help='The database with string game IDs, e.g. postgresql://localhost/9dt_legacy')
+    parser.add_argument('database_uri', help='The database to copy the games into, e.g. postgresql://localhost/9dt')
+    args = parser.parse_args()
+    target_app = create_database_app(args.database_uri)
+    db.init_app(target_app)
+    with target_app.app_context():
+        db.create_all()
+    print('Migrated {} games.'.format(migrate_legacy_games(create_engine(args.legacy_database_uri), target_app)))
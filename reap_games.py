@@ -0,0 +1,13 @@
+from app import data_provider, flask_app
+from argparse import ArgumentParser
+from game_reaper import GameReaper
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Finishes in-progress games that have had no moves for longer than a TTL.')
+    parser.add_argument('--ttl-seconds', type=int, default=flask_app.config['GAME_REAPER_TTL_SECONDS'] or 86400)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--batch-pause-seconds', type=float, default=0.1)
+    args = parser.parse_args()
+    game_reaper = GameReaper(data_provider, args.ttl_seconds, batch_size=args.batch_size,
+                             batch_pause_seconds=args.batch_pause_seconds)
+    print('Finished {} inactive games.'.format(game_reaper.reap()))
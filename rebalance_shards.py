@@ -0,0 +1,7 @@
+from app import data_provider
+from sharded_data_provider import ShardedDataProvider
+
+if __name__ == '__main__':
+    if not isinstance(data_provider, ShardedDataProvider):
+        raise SystemExit('SHARD_DATABASE_URIS is not configured, there are no shards to rebalance.')
+    print('Moved {} games.'.format(data_provider.rebalance()))
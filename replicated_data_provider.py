@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from data_provider import DataProviderInterface
+from interface import implements
+from logging import getLogger
+from random import choice
+from sqlalchemy.exc import SQLAlchemyError
+from sql_data_provider import create_database_app, SQLAlchemyDataProvider
+from threading import Event, Lock, Thread
+
+logger = getLogger(__name__)
+
+
+class ReplicatedDataProvider(implements(DataProviderInterface)):
+    """
+    A DataProviderInterface implementation that sends writes to a primary data provider and reads to its replicas.
+
+    Reads are kept consistent with writes by move count: the number of moves written for each game through this
+    provider is remembered, and a replica's copy of a game is only used when it includes at least that many moves (or
+    the min_move_count requested by the caller), otherwise the game is read from the primary. A written move count is
+    only forgotten once check_replica_lag finds every replica that may receive reads has caught up with it.
+    """
+    def __init__(self, primary, replicas, max_lag_moves=100, max_tracked_games=10000):
+        """
+        Parameters
+        ----------
+        primary : SQLAlchemyDataProvider
+            The data provider all writes are sent to.
+        replicas : list
+            The SQLAlchemyDataProvider of each replica of the primary.
+        max_lag_moves : int
+            The number of moves a replica may be behind the primary before it stops receiving reads.
+        max_tracked_games : int
+            The number of recently written games whose move count is remembered.
+        """
+        self.primary = primary
+        self.replicas = replicas
+        self.healthy_replicas = list(replicas)
+        self.max_lag_moves = max_lag_moves
+        self.max_tracked_games = max_tracked_games
+        self.written_move_counts = OrderedDict()
+        self.lock = Lock()
+        self.stop_lag_monitor_event = Event()
+
+    @classmethod
+    def from_database_uris(cls, primary, replica_database_uris, **kwargs):
+        """ Creates a ReplicatedDataProvider with a SQLAlchemyDataProvider per replica database URI. """
+        return cls(primary, [SQLAlchemyDataProvider(create_database_app(database_uri))
+                             for database_uri in replica_database_uris], **kwargs)
+
+    def get_all_active_game_ids(self):
+        replica = self.choose_replica()
+        if replica:
+            try:
+                return replica.get_all_active_game_ids()
+            except SQLAlchemyError:
+                self.eject_replica(replica)
+        return self.primary.get_all_active_game_ids()
+
+    def create_game(self, game_id, columns, rows, players):
+        self.primary.create_game(game_id, columns, rows, players)
+
+    def get_game_by_id(self, game_id, player_id=None, serialize_players=False, min_move_count=0):
+        with self.lock:
+            written_move_count = self.written_move_counts.get(game_id, 0)
+        replica = self.choose_replica()
+        # Player scoped reads are made by the player about to quit, so they must see the latest state.
+        if replica and not player_id:
+            try:
+                game = replica.get_game_by_id(game_id, serialize_players=serialize_players)
+            except SQLAlchemyError:
+                self.eject_replica(replica)
+            else:
+                # A missing game may not have been replicated yet, so only trust games that are up to date.
+                if game and len(game.moves) >= max(min_move_count, written_move_count):
+                    return game
+        return self.primary.get_game_by_id(game_id, player_id=player_id, serialize_players=serialize_players)
+
+    def get_game_for_player_with_board(self, game_id, player_id):
+        return self.primary.get_game_for_player_with_board(game_id, player_id)
+
+    def persist_new_move_and_game_state(self, game_dao, player_id, move_type, column=None):
+        self.primary.persist_new_move_and_game_state(game_dao, player_id, move_type, column=column)
+        with self.lock:
+            self.written_move_counts.pop(game_dao.id, None)
+            self.written_move_counts[game_dao.id] = len(game_dao.moves) + 1
+            if len(self.written_move_counts) > self.max_tracked_games:
+                self.written_move_counts.popitem(last=False)
+
+    def get_move_rows(self, game_ids):
+        with self.lock:
+            has_written_moves = any(game_id in self.written_move_counts for game_id in game_ids)
+        replica = self.choose_replica()
+        # Rows are streamed, so a replica failing part way through cannot fall back to the primary.
+        data_provider = replica if replica and not has_written_moves else self.primary
+        return data_provider.get_move_rows(game_ids)
+
+    def expire_inactive_games(self, inactive_since, max_games):
+        return self.primary.expire_inactive_games(inactive_since, max_games)
+
+    def choose_replica(self):
+        """ Provides a random healthy replica, or None if there are none. """
+        healthy_replicas = self.healthy_replicas
+        return choice(healthy_replicas) if healthy_replicas else None
+
+    def eject_replica(self, replica):
+        """ Stops sending reads to the given replica, until check_replica_lag finds it has caught up. """
+        with self.lock:
+            self.healthy_replicas = [healthy for healthy in self.healthy_replicas if healthy is not replica]
+
+    def check_replica_lag(self):
+        """
+        Measures how many moves each replica is behind the primary, ejecting lagging or unreachable replicas and
+        restoring ejected replicas once they have fully caught up.
+
+        When every replica left receiving reads has fully caught up, the written move counts tracked before the check
+        are forgotten, as those moves can be read from any of them.
+
+        Returns
+        -------
+        list
+            The lag, in moves, of each replica; None for a replica that could not be reached.
+
+        """
+        with self.lock:
+            written_before_check = list(self.written_move_counts.items())
+        primary_last_move_id = self.primary.get_last_move_id()
+        replica_lags = []
+        for replica in self.replicas:
+            try:
+                replica_lags.append(max(primary_last_move_id - replica.get_last_move_id(), 0))
+            except SQLAlchemyError:
+                replica_lags.append(None)
+        with self.lock:
+            # An ejected replica must fully catch up before it is restored, as it may be missing forgotten moves.
+            self.healthy_replicas = [replica for replica, lag in zip(self.replicas, replica_lags)
+                                     if lag == 0 or (lag is not None and lag <= self.max_lag_moves and
+                                                     replica in self.healthy_replicas)]
+            if all(lag == 0 for replica, lag in zip(self.replicas, replica_lags) if replica in self.healthy_replicas):
+                for game_id, written_move_count in written_before_check:
+                    if self.written_move_counts.get(game_id) == written_move_count:
+                        del self.written_move_counts[game_id]
+        return replica_lags
+
+    def start_lag_monitor(self, interval_seconds=5):
+        """ Starts a background thread calling check_replica_lag every interval_seconds. """
+        def monitor_lag():
+            while not self.stop_lag_monitor_event.wait(interval_seconds):
+                try:
+                    self.check_replica_lag()
+                except Exception:
+                    # e.g. the primary is unreachable; keep the current replicas until it can be compared against.
+                    logger.exception('Failed to check replica lag, retrying next interval.')
+        self.stop_lag_monitor_event.clear()
+        monitor_thread = Thread(target=monitor_lag)
+        monitor_thread.daemon = True
+        monitor_thread.start()
+
+    def stop_lag_monitor(self):
+        """ Stops the background thread started by start_lag_monitor. """
+        self.stop_lag_monitor_event.set()
@@ -0,0 +1,106 @@
+from data_provider import DataProviderInterface
+from game_ids import normalize_game_id
+from hashlib import md5
+from interface import implements
+from multiprocessing.pool import ThreadPool
+from sql_data_provider import create_database_app, SQLAlchemyDataProvider
+
+
+class ShardedDataProvider(implements(DataProviderInterface)):
+    """
+    A DataProviderInterface implementation that spreads games across several data providers (shards).
+
+    Each game is owned by a single shard, chosen by rendezvous hashing of the game ID against the shard names. This
+    keeps the owner stable across processes, and when a shard is added only the games that now hash to the new shard
+    have to be moved (see rebalance).
+    """
+    def __init__(self, shards):
+        if not shards:
+            raise ValueError('At least one shard is required.')
+        self.shards = shards
+        self.pool = ThreadPool(len(shards))
+
+    @classmethod
+    def from_database_uris(cls, database_uris):
+        """
+        Creates a ShardedDataProvider with a SQLAlchemyDataProvider shard per database.
+
+        Parameters
+        ----------
+        database_uris : dict
+            A mapping of shard names to the SQLAlchemy database URI of the shard. Shard names must never change once
+            games are stored, as they determine which shard owns a game.
+
+        Returns
+        -------
+        ShardedDataProvider
+            The provider routing to the given databases.
+
+        """
+        return cls({name: SQLAlchemyDataProvider(create_database_app(database_uri))
+                    for name, database_uri in database_uris.items()})
+
+    def get_shard_name(self, game_id):
+        """ Provides the name of the shard that owns the given game ID. """
+        # Compact IDs written differently (e.g. uppercased) must be owned by the same shard.
+        game_id = normalize_game_id(game_id)
+        return max(self.shards, key=lambda name: md5('{}/{}'.format(name, game_id).encode('utf-8')).hexdigest())
+
+    def get_shard(self, game_id):
+        """ Provides the data provider of the shard that owns the given game ID. """
+        return self.shards[self.get_shard_name(game_id)]
+
+    def get_all_active_game_ids(self):
+        results = self.pool.map(lambda shard: shard.get_all_active_game_ids(), list(self.shards.values()))
+        return [game_id for shard_game_ids in results for game_id in shard_game_ids]
+
+    def create_game(self, game_id, columns, rows, players):
+        self.get_shard(game_id).create_game(game_id, columns, rows, players)
+
+    def get_game_by_id(self, game_id, player_id=None, serialize_players=False, min_move_count=0):
+        return self.get_shard(game_id).get_game_by_id(game_id, player_id=player_id,
+                                                       serialize_players=serialize_players,
+                                                       min_move_count=min_move_count)
+
+    def get_game_for_player_with_board(self, game_id, player_id):
+        return self.get_shard(game_id).get_game_for_player_with_board(game_id, player_id)
+
+    def persist_new_move_and_game_state(self, game_dao, player_id, move_type, column=None):
+        self.get_shard(game_dao.id).persist_new_move_and_game_state(game_dao, player_id, move_type, column=column)
+
+    def get_move_rows(self, game_ids):
+        shard_game_ids = {}
+        for game_id in game_ids:
+            shard_game_ids.setdefault(self.get_shard_name(game_id), []).append(game_id)
+        for shard_name, game_ids_on_shard in shard_game_ids.items():
+            for row in self.shards[shard_name].get_move_rows(game_ids_on_shard):
+                yield row
+
+    def expire_inactive_games(self, inactive_since, max_games):
+        # Each shard is a separate database, so max_games bounds the games locked on each shard.
+        return sum(shard.expire_inactive_games(inactive_since, max_games) for shard in self.shards.values())
+
+    def rebalance(self):
+        """
+        Moves every game that is stored on a shard other than the shard that owns it, e.g. after adding a shard.
+
+        Each game is copied to its owner before being deleted from its old shard, so an interrupted rebalance can
+        safely be run again. Games being moved are not reachable until they are copied, so this should be run while
+        the API is not accepting traffic.
+
+        Returns
+        -------
+        int
+            The number of games moved.
+
+        """
+        moved_count = 0
+        for shard_name, shard in self.shards.items():
+            for game_id in shard.get_all_game_ids():
+                owner_name = self.get_shard_name(game_id)
+                if owner_name != shard_name:
+                    self.shards[owner_name].import_game(shard.export_game(game_id))
+                    shard.delete_game(game_id)
+                    moved_count += 1
+        return moved_count
+
@@ -1,10 +1,16 @@
-from data_provider import DataProviderInterface, GameDAO, MoveDAO
+from data_provider import DataProviderInterface, GameDAO, GameDoneError, GameExistsError, MoveDAO
 from datetime import datetime
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from game_ids import decode_game_id, encode_game_id, generate_game_id
 from interface import implements
 from pickle import dumps, loads
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
 
 db = SQLAlchemy()
+# The number of compact IDs generated for a game created with a legacy ID before giving up on collisions.
+GENERATED_ID_ATTEMPTS = 3
 
 
 ###
@@ -12,7 +18,9 @@ db = SQLAlchemy()
 ###
 class Game(db.Model):
     """ A SQLAlchemy DB definition of the Game object. """
-    id = db.Column(db.String, nullable=False, primary_key=True, unique=True)
+    id = db.Column(db.BigInteger, nullable=False, primary_key=True, autoincrement=False)
+    # The string ID of a game created before compact IDs (see game_ids.py), which it is still found by.
+    legacy_id = db.Column(db.String, nullable=True, unique=True)
     columns = db.Column(db.Integer, nullable=False)
     rows = db.Column(db.Integer, nullable=False)
     initial_players = db.Column(db.String, nullable=False)
@@ -20,7 +28,10 @@ class Game(db.Model):
     current_active_player_index = db.Column(db.Integer, nullable=False, default=0)
     state = db.Column(db.Integer, nullable=False, default=0)
     winner = db.Column(db.String, nullable=True)
+    last_activity = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     moves = db.relationship('Move', backref=db.backref('games', lazy=True))
+    # Finds the in-progress games, and those inactive for longest, without scanning the table.
+    __table_args__ = (db.Index('ix_game_state_last_activity', 'state', 'last_activity'),)
 
 
 class Move(db.Model):
@@ -28,11 +39,23 @@ class Move(db.Model):
     id = db.Column(db.Integer, nullable=False, primary_key=True)
     player_id = db.Column(db.String, nullable=False)
     pub_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    game_id = db.Column(db.String, db.ForeignKey('game.id'), nullable=False)
+    game_id = db.Column(db.BigInteger, db.ForeignKey('game.id'), nullable=False, index=True)
     move_type = db.Column(db.String, nullable=False)
     column = db.Column(db.Integer, nullable=True)
 
 
+class JournalCheckpoint(db.Model):
+    """ A SQLAlchemy DB definition of the last move journal entry persisted from a journal. """
+    journal_name = db.Column(db.String, nullable=False, primary_key=True)
+    last_sequence = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Selects plain move rows, outer joined so games without moves still provide a row.
+MOVE_ROWS_QUERY = text('SELECT game.id, game.legacy_id, move.player_id, move.move_type, move."column" FROM game '
+                       'LEFT OUTER JOIN move ON move.game_id = game.id WHERE game.id IN :game_ids '
+                       'ORDER BY game.id, move.id').bindparams(bindparam('game_ids', expanding=True))
+
+
 class SQLAlchemyDataProvider(implements(DataProviderInterface)):
     """ A SQLAlchemy implementation of the DataProviderInterface. """
     def __init__(self, app):
@@ -41,23 +64,33 @@ class SQLAlchemyDataProvider(implements(DataProviderInterface)):
 
     def get_all_active_game_ids(self):
         with self.app.app_context():
-            games = Game.query.all()
-            return [game.id for game in games if game.state is GameDAO.GAME_STATE_IN_PROGRESS]
+            query = db.session.query(Game.id, Game.legacy_id).filter_by(state=GameDAO.GAME_STATE_IN_PROGRESS)
+            return [get_public_game_id(game_id, legacy_id) for game_id, legacy_id in query.all()]
 
     def create_game(self, game_id, columns, rows, players):
-        with self.app.app_context():
-            db.session.add(Game(id=game_id, columns=columns, rows=rows,
-                                initial_players=dumps(players), active_players=dumps(players)))
-            db.session.commit()
+        compact_id = decode_game_id(game_id)
+        legacy_id = game_id if compact_id is None else None
+        # The compact ID of a game created with a legacy ID is never shown, so it can be generated again on a collision.
+        for _ in range(GENERATED_ID_ATTEMPTS if legacy_id else 1):
+            with self.app.app_context():
+                db.session.add(Game(id=generate_game_id() if legacy_id else compact_id, legacy_id=legacy_id,
+                                    columns=columns, rows=rows, initial_players=dumps(players),
+                                    active_players=dumps(players)))
+                try:
+                    db.session.commit()
+                    return
+                except IntegrityError:
+                    db.session.rollback()
+        raise GameExistsError('Game {} already exists.'.format(game_id))
 
-    def get_game_by_id(self, game_id, player_id=None, serialize_players=False):
+    def get_game_by_id(self, game_id, player_id=None, serialize_players=False, min_move_count=0):
         with self.app.app_context():
-            game = Game.query.filter_by(id=game_id).first()
+            game = Game.query.filter(get_game_criterion(game_id)).first()
             if not game:
                 return None
             else:
-                game_dao = GameDAO(game.id, game.columns, game.rows, state=game.state,
-                                   winner=game.winner, moves=game.moves)
+                game_dao = GameDAO(get_public_game_id(game.id, game.legacy_id), game.columns, game.rows,
+                                   state=game.state, winner=game.winner, moves=game.moves)
             if player_id or serialize_players:
                 game_dao.active_players_list = loads(game.active_players)
                 game_dao.initial_players_list = loads(game.initial_players)
@@ -81,10 +114,168 @@ class SQLAlchemyDataProvider(implements(DataProviderInterface)):
 
     def persist_new_move_and_game_state(self, game_dao, player_id, move_type, column=None):
         with self.app.app_context():
-            game = Game.query.filter_by(id=game_dao.id).first()
+            # The row is locked so the game can not be finished (e.g. by expire_inactive_games) before the commit.
+            game = Game.query.filter(get_game_criterion(game_dao.id)).with_for_update().first()
+            if game.state != GameDAO.GAME_STATE_IN_PROGRESS:
+                db.session.rollback()
+                raise GameDoneError('Game {} is no longer in progress.'.format(game_dao.id))
             game.active_players = dumps(game_dao.active_players_list)
             game.current_active_player_index = game_dao.current_active_player_index
             game.winner = game_dao.winner
             game.state = game_dao.state
-            game.moves.append(Move(player_id=player_id, move_type=move_type, column=column))
+            game.last_activity = datetime.utcnow()
+            game.moves.append(Move(player_id=player_id, move_type=move_type, column=column,
+                                   pub_date=game.last_activity))
+            db.session.commit()
+
+    def get_journal_checkpoint(self, journal_name):
+        """ Provides the sequence of the last persisted entry of the given move journal, or 0 if there is none. """
+        with self.app.app_context():
+            checkpoint = JournalCheckpoint.query.filter_by(journal_name=journal_name).first()
+            return checkpoint.last_sequence if checkpoint else 0
+
+    def persist_journal_entries(self, journal_name, entries):
+        """
+        Persists move journal entries, and the journal's checkpoint, in a single commit.
+
+        Entries at or before the journal's checkpoint have already been persisted and are skipped, so a batch can
+        safely be persisted again after a failure. Entries of games that no longer exist, or are no longer in progress
+        (e.g. expired by the game reaper after the move was journaled), are skipped.
+
+        Parameters
+        ----------
+        journal_name : str
+            The name of the journal the entries were read from.
+        entries : list
+            The journal entries, in sequence order, as written by JournaledDataProvider.
+
+        """
+        with self.app.app_context():
+            checkpoint = JournalCheckpoint.query.filter_by(journal_name=journal_name).first()
+            if not checkpoint:
+                checkpoint = JournalCheckpoint(journal_name=journal_name, last_sequence=0)
+                db.session.add(checkpoint)
+            for entry in entries:
+                if entry['sequence'] <= checkpoint.last_sequence:
+                    continue
+                game = Game.query.filter(get_game_criterion(entry['game_id'])).with_for_update().first()
+                checkpoint.last_sequence = entry['sequence']
+                if not game or game.state != GameDAO.GAME_STATE_IN_PROGRESS:
+                    # The game has been deleted (or moved to another database) or finished since the move was
+                    # journaled.
+                    continue
+                game.active_players = dumps(entry['active_players'])
+                game.current_active_player_index = entry['current_active_player_index']
+                game.winner = entry['winner']
+                game.state = entry['state']
+                game.last_activity = datetime.utcfromtimestamp(entry['timestamp'])
+                game.moves.append(Move(player_id=entry['player_id'], move_type=entry['move_type'],
+                                       column=entry['column'], pub_date=game.last_activity))
+            db.session.commit()
+
+    def expire_inactive_games(self, inactive_since, max_games):
+        with self.app.app_context():
+            game_ids = [game_id for game_id, in db.session.query(Game.id)
+                        .filter(Game.state == GameDAO.GAME_STATE_IN_PROGRESS, Game.last_activity < inactive_since)
+                        .order_by(Game.last_activity).limit(max_games).all()]
+            if not game_ids:
+                return 0
+            # The criteria are checked again, so a game that has been played since it was selected is not expired.
+            expired_count = Game.query.filter(Game.id.in_(game_ids), Game.state == GameDAO.GAME_STATE_IN_PROGRESS,
+                                              Game.last_activity < inactive_since) \
+                .update({Game.state: GameDAO.GAME_STATE_DONE}, synchronize_session=False)
+            db.session.commit()
+            return expired_count
+
+    def get_move_rows(self, game_ids):
+        compact_ids = [decode_game_id(game_id) for game_id in game_ids]
+        legacy_ids = [game_id for game_id, compact_id in zip(game_ids, compact_ids) if compact_id is None]
+        compact_ids = [compact_id for compact_id in compact_ids if compact_id is not None]
+        with self.app.app_context():
+            if legacy_ids:
+                compact_ids += [compact_id for compact_id, in
+                                db.session.query(Game.id).filter(Game.legacy_id.in_(legacy_ids)).all()]
+            engine = db.engine
+        if not compact_ids:
+            return
+        # Rows are read through a server-side cursor on a dedicated connection, which is held until iteration ends.
+        connection = engine.connect()
+        try:
+            result = connection.execution_options(stream_results=True).execute(MOVE_ROWS_QUERY,
+                                                                               {'game_ids': compact_ids})
+            for row in result:
+                yield (get_public_game_id(row[0], row[1]),) + tuple(row[2:])
+        finally:
+            connection.close()
+
+    def get_last_move_id(self):
+        """ Provides the ID of the most recently stored move, or 0 if there are no moves. """
+        with self.app.app_context():
+            return db.session.query(db.func.max(Move.id)).scalar() or 0
+
+    def get_all_game_ids(self):
+        """ Provides the IDs of every stored game, regardless of state. """
+        with self.app.app_context():
+            return [get_public_game_id(game_id, legacy_id)
+                    for game_id, legacy_id in db.session.query(Game.id, Game.legacy_id).all()]
+
+    def export_game(self, game_id):
+        """ Provides the complete stored record of a game and its moves, so it can be imported into another DB. """
+        with self.app.app_context():
+            game = Game.query.filter(get_game_criterion(game_id)).first()
+            if not game:
+                return None
+            moves = []
+            for move in sorted(game.moves, key=lambda game_move: game_move.id):
+                move_values = get_column_values(move)
+                # Move IDs are local to a database, the importing DB assigns new ones in the same order.
+                del move_values['id']
+                moves.append(move_values)
+            return {'game': get_column_values(game), 'moves': moves}
+
+    def import_game(self, game_record):
+        """ Persists a game record provided by export_game; does nothing if the game already exists. """
+        with self.app.app_context():
+            if Game.query.filter_by(id=game_record['game']['id']).first():
+                return
+            game = Game(**game_record['game'])
+            game.moves = [Move(**move_values) for move_values in game_record['moves']]
+            db.session.add(game)
+            db.session.commit()
+
+    def delete_game(self, game_id):
+        """ Deletes a game and all of its moves. """
+        with self.app.app_context():
+            game = Game.query.filter(get_game_criterion(game_id)).first()
+            if not game:
+                return
+            Move.query.filter_by(game_id=game.id).delete()
+            Game.query.filter_by(id=game.id).delete()
             db.session.commit()
+
+
+###
+# Util methods
+###
+def get_column_values(model):
+    """ Provides a dict of the column names to values of the given DB model. """
+    return {column.name: getattr(model, column.name) for column in model.__table__.columns}
+
+
+def get_game_criterion(game_id):
+    """ Provides the query criterion matching the game with the given compact or legacy ID. """
+    compact_id = decode_game_id(game_id)
+    return Game.id == compact_id if compact_id is not None else Game.legacy_id == game_id
+
+
+def get_public_game_id(game_id, legacy_id):
+    """ Provides the ID clients know a game by; its legacy ID if it has one, otherwise its encoded compact ID. """
+    return legacy_id or encode_game_id(game_id)
+
+
+def create_database_app(database_uri):
+    """ Creates a Flask app, and therefore a separate SQLAlchemy engine, for an additional database (shard/replica). """
+    database_app = Flask(__name__)
+    database_app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    database_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    return database_app
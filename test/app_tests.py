@@ -1,10 +1,15 @@
 import unittest
 
-from app import flask_app, data_provider
-from data_provider import GameDAO, MoveDAO
+from app import create_data_provider, flask_app, data_provider
+from data_provider import GameDAO, GameDoneError, GameExistsError, MoveDAO
+from flask import Flask
+from game_ids import decode_game_id
 from json import dumps, loads
 from mock import MagicMock
+from os import path
+from sql_data_provider import SQLAlchemyDataProvider
 from sys import getdefaultencoding
+from test.helpers import SQLiteTest
 
 EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
 EXPECTED_GAME_ID = 'EXPECTED_GAME_MODEL_ID'
@@ -60,9 +65,24 @@ class GameStateTest(BaseTest):
         # THEN the response output contains a gameId
         output = parse_json_response(response.get_data())
         self.assertTrue(output['gameId'] is not None)
+        # THEN the gameId is a compact game ID
+        self.assertIsNotNone(decode_game_id(output['gameId']))
         # THEN the game is created
         data_provider.create_game.assert_called_once()
 
+    def test_create_game_duplicate_id(self):
+        # GIVEN the first generated game ID is already in use
+        request_data = dumps({'players': ['player1', 'player2'], 'columns': 4, 'rows': 4})
+        data_provider.create_game = MagicMock(side_effect=[GameExistsError(), None])
+        # WHEN POST new game is called
+        response = self.app.post('/drop_token', data=request_data, content_type='application/json')
+        # THEN the game is created with a new game ID
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(data_provider.create_game.call_count, 2)
+        game_ids = [call[0][0] for call in data_provider.create_game.call_args_list]
+        self.assertNotEquals(game_ids[0], game_ids[1])
+        self.assertEquals(parse_json_response(response.get_data())['gameId'], game_ids[1])
+
     def test_create_game_missing_players(self):
         # GIVEN input missing players
         expected_columns, expected_rows = 4, 4
@@ -149,6 +169,16 @@ class GameStateByIdTest(BaseTest):
                                                                      'state': 'DONE',
                                                                      'winner': None})
 
+    def test_get_game_state_uppercase_id(self):
+        # GIVEN a game exists
+        data_provider.get_game_by_id = MagicMock(return_value=GameDAO('0dbq3v7k2n5xe', EXPECTED_COLUMNS, EXPECTED_ROWS,
+                                                                      initial_players_list=self.expected_players))
+        # WHEN GET game state is called with the game ID uppercased
+        response = self.app.get('/drop_token/0DBQ3V7K2N5XE')
+        # THEN the game is looked up by its stored ID
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(data_provider.get_game_by_id.call_args[0][0], '0dbq3v7k2n5xe')
+
     def test_get_game_state_not_found(self):
         # GIVEN a valid game exists
         data_provider.get_game_by_id = MagicMock(return_value=None)
@@ -158,6 +188,23 @@ class GameStateByIdTest(BaseTest):
         self.assertEquals(response.status_code, 404)
 
 
+class MoveTest(BaseTest):
+    def test_get_move(self):
+        # GIVEN a game with moves
+        moves = [MoveDAO(move[0], move_type=move[1], column=move[2]) for move in EXPECTED_MOVE_VALUES_ACTIVE_GAME]
+        data_provider.get_game_by_id = MagicMock(return_value=GameDAO(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS,
+                                                                      moves=moves))
+        # WHEN GET a move is called
+        response = self.app.get('/drop_token/{}/moves/1'.format(EXPECTED_GAME_ID))
+        # THEN the response code is 200
+        self.assertEquals(response.status_code, 200)
+        # THEN the response output is the move
+        self.assertEquals(parse_json_response(response.get_data()), {'type': MoveDAO.TYPE_MOVE, 'player': 'player2',
+                                                                     'column': 0})
+        # THEN the game is required to include the move
+        self.assertEquals(data_provider.get_game_by_id.call_args[1]['min_move_count'], 2)
+
+
 class MoveListTest(BaseTest):
     def test_get_list_of_moves(self):
         # GIVEN a list of moves
@@ -190,6 +237,66 @@ class MoveListTest(BaseTest):
         self.assertEquals(response.status_code, 404)
 
 
+class MoveStreamTest(BaseTest):
+    def test_stream_moves(self):
+        # GIVEN a game with moves
+        rows = [(EXPECTED_GAME_ID,) + move for move in EXPECTED_MOVE_VALUES_ACTIVE_GAME]
+        data_provider.get_move_rows = MagicMock(return_value=iter(rows))
+        # WHEN GET the moves stream is called
+        response = self.app.get('/drop_token/{}/moves.ndjson'.format(EXPECTED_GAME_ID))
+        # THEN the response code is 200
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.mimetype, 'application/x-ndjson')
+        # THEN the response output contains a line per move
+        output_moves = [loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEquals(output_moves, [{'type': MoveDAO.TYPE_MOVE, 'player': 'player1', 'column': 0},
+                                         {'type': MoveDAO.TYPE_MOVE, 'player': 'player2', 'column': 0},
+                                         {'type': MoveDAO.TYPE_QUIT, 'player': 'player1'}])
+
+    def test_stream_moves_no_moves(self):
+        # GIVEN a game without moves
+        data_provider.get_move_rows = MagicMock(return_value=iter([(EXPECTED_GAME_ID, None, None, None)]))
+        # WHEN GET the moves stream is called
+        response = self.app.get('/drop_token/{}/moves.ndjson'.format(EXPECTED_GAME_ID))
+        # THEN the response code is 200
+        self.assertEquals(response.status_code, 200)
+        # THEN the response output is empty
+        self.assertEquals(response.get_data(), b'')
+
+    def test_stream_moves_game_not_found(self):
+        # GIVEN a game is not found
+        data_provider.get_move_rows = MagicMock(return_value=iter([]))
+        # WHEN GET the moves stream is called with a non-existent gameId
+        response = self.app.get('/drop_token/{}/moves.ndjson'.format('foo'))
+        # THEN the response code is 404
+        self.assertEquals(response.status_code, 404)
+
+    def test_export_moves(self):
+        # GIVEN multiple games with moves
+        rows = [('game1', 'player1', MoveDAO.TYPE_MOVE, 2), ('game2', None, None, None),
+                ('game3', 'player2', MoveDAO.TYPE_QUIT, None)]
+        data_provider.get_move_rows = MagicMock(return_value=iter(rows))
+        # WHEN GET the moves export is called
+        response = self.app.get('/drop_token/moves.ndjson?gameIds=game1,game2,game3')
+        # THEN the response code is 200
+        self.assertEquals(response.status_code, 200)
+        # THEN the moves of the requested games are provided
+        data_provider.get_move_rows.assert_called_once_with(['game1', 'game2', 'game3'])
+        # THEN the response output contains a line per move
+        output_moves = [loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEquals(output_moves, [{'gameId': 'game1', 'type': MoveDAO.TYPE_MOVE, 'player': 'player1', 'column': 2},
+                                         {'gameId': 'game3', 'type': MoveDAO.TYPE_QUIT, 'player': 'player2'}])
+
+    def test_export_moves_missing_game_ids(self):
+        # GIVEN no gameIds argument
+        data_provider.get_move_rows = MagicMock()
+        # WHEN GET the moves export is called
+        response = self.app.get('/drop_token/moves.ndjson')
+        # THEN the response code is 400
+        self.assertEquals(response.status_code, 400)
+        data_provider.get_move_rows.assert_not_called()
+
+
 class PlayerMoveTest(BaseTest):
     def test_post_move(self):
         # GIVEN a valid game exists
@@ -212,6 +319,21 @@ class PlayerMoveTest(BaseTest):
         # THEN the response output is correct
         self.assertEquals(parse_json_response(response.get_data()), {'move': '{}/moves/0'.format(EXPECTED_GAME_ID)})
 
+    def test_post_move_game_expired(self):
+        # GIVEN a valid game exists, which is finished before the move is persisted
+        data_provider.get_game_for_player_with_board = MagicMock(return_value=GameDAO(EXPECTED_GAME_ID,
+                                                                                      EXPECTED_COLUMNS, EXPECTED_ROWS,
+                                                                                      state=GameDAO.GAME_STATE_IN_PROGRESS,
+                                                                                      active_players_list=self.expected_players,
+                                                                                      initial_players_list=self.expected_players,
+                                                                                      board=[[''] * 4 for _ in range(4)]))
+        data_provider.persist_new_move_and_game_state = MagicMock(side_effect=GameDoneError())
+        # WHEN POST a move is called
+        response = self.app.post('/drop_token/{}/{}'.format(EXPECTED_GAME_ID, EXPECTED_PLAYER_1),
+                                 data=dumps({'column': 0}), content_type='application/json')
+        # THEN the response code is 410
+        self.assertEquals(response.status_code, 410)
+
     def test_delete_move_quit(self):
         # GIVEN a valid game exists
         data_provider.get_game_by_id = MagicMock(return_value=GameDAO(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS,
@@ -226,5 +348,33 @@ class PlayerMoveTest(BaseTest):
         # THEN the response code is 202
         self.assertEquals(response.status_code, 202)
 
+
+class CreateDataProviderTest(SQLiteTest):
+    def create_app(self, **config):
+        app = Flask(__name__)
+        app.config.update({'SQLALCHEMY_DATABASE_URI': self.get_database_uri('games'),
+                           'SQLALCHEMY_TRACK_MODIFICATIONS': False, 'SHARD_DATABASE_URIS': {},
+                           'REPLICA_DATABASE_URIS': [], 'MOVE_JOURNAL_PATH': None})
+        app.config.update(config)
+        return app
+
+    def test_move_journal_not_opened(self):
+        # GIVEN a move journal is configured
+        journal_path = path.join(self.database_dir, 'moves.journal')
+        app = self.create_app(MOVE_JOURNAL_PATH=journal_path)
+        # WHEN the data provider is created, as when the module is imported by a script
+        result = create_data_provider(app)
+        # THEN the database is used directly, without opening the journal
+        self.assertIsInstance(result, SQLAlchemyDataProvider)
+        self.assertFalse(path.exists(journal_path))
+
+    def test_conflicting_config(self):
+        # GIVEN both shards and read replicas are configured
+        app = self.create_app(SHARD_DATABASE_URIS={'shard0': 'sqlite://'}, REPLICA_DATABASE_URIS=['sqlite://'])
+        # WHEN the data provider is created
+        # THEN a configuration error is raised rather than one of them being ignored
+        with self.assertRaises(ValueError):
+            create_data_provider(app)
+
 if __name__ == '__main__':
     unittest.main()
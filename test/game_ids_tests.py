@@ -0,0 +1,46 @@
+import unittest
+
+from game_ids import decode_game_id, encode_game_id, generate_game_id, MAX_GAME_ID, normalize_game_id
+
+EXPECTED_TIMESTAMP = 1600000000.0
+
+
+class GameIdTest(unittest.TestCase):
+    def test_encode_decode(self):
+        # GIVEN generated game IDs, and the smallest and largest game IDs
+        for game_id in [generate_game_id() for _ in range(100)] + [0, MAX_GAME_ID]:
+            # WHEN the game ID is encoded
+            encoded_game_id = encode_game_id(game_id)
+            # THEN it is a fixed length URL safe string
+            self.assertEquals(len(encoded_game_id), 13)
+            self.assertTrue(encoded_game_id.isalnum())
+            # THEN it decodes to the game ID
+            self.assertEquals(decode_game_id(encoded_game_id), game_id)
+
+    def test_time_ordered(self):
+        # GIVEN game IDs generated a millisecond apart
+        earlier_game_id = generate_game_id(EXPECTED_TIMESTAMP)
+        later_game_id = generate_game_id(EXPECTED_TIMESTAMP + 0.001)
+        # THEN the later game ID, and its encoding, sort after the earlier one
+        self.assertTrue(earlier_game_id < later_game_id <= MAX_GAME_ID)
+        self.assertTrue(encode_game_id(earlier_game_id) < encode_game_id(later_game_id))
+
+    def test_decode_crockford_variants(self):
+        # GIVEN a game ID uppercased, and written with letters mistaken for digits
+        for written_game_id in '0DBQ3V7K2N5XE', 'odbq3v7k2n5xe', '0dbq3v7k2n5xe'.replace('0', 'O'):
+            # WHEN the game ID is decoded
+            # THEN it decodes to the same game ID
+            self.assertEquals(decode_game_id(written_game_id), decode_game_id('0dbq3v7k2n5xe'))
+            self.assertEquals(normalize_game_id(written_game_id), '0dbq3v7k2n5xe')
+        self.assertEquals(decode_game_id('i000000000001'), decode_game_id('L000000000001'))
+        self.assertEquals(decode_game_id('i000000000001'), decode_game_id('1000000000001'))
+
+    def test_decode_legacy_id(self):
+        # GIVEN IDs that were not created by encode_game_id
+        for legacy_id in '8d0dba4e-5b56-4a3a-9b3c-3d1c2b8a9f10', 'EXPECTED_GAME_ID', 'zzzzzzzzzzzzz', 'uuuuuuuuuuuuu':
+            # WHEN the ID is decoded
+            # THEN it is not a compact game ID
+            self.assertIsNone(decode_game_id(legacy_id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from data_provider import GameDAO, GameDoneError, MoveDAO
+from datetime import datetime, timedelta
+from game_reaper import GameReaper
+from sql_data_provider import db, Game
+from test.helpers import SQLiteTest
+
+EXPECTED_PLAYER_1, EXPECTED_PLAYER_2 = 'EXPECTED_PLAYER_1', 'EXPECTED_PLAYER_2'
+EXPECTED_PLAYERS = [EXPECTED_PLAYER_1, EXPECTED_PLAYER_2]
+EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
+INACTIVE_GAME_IDS = ['INACTIVE_GAME_ID_{}'.format(index) for index in range(5)]
+ACTIVE_GAME_ID = 'ACTIVE_GAME_ID'
+TTL_SECONDS = 3600
+
+
+class BaseTest(SQLiteTest):
+    def setUp(self):
+        super(BaseTest, self).setUp()
+        self.data_provider = self.create_sql_data_provider('games')
+        # GIVEN games without moves for longer than the TTL, and a game with a recent move
+        for game_id in INACTIVE_GAME_IDS + [ACTIVE_GAME_ID]:
+            self.data_provider.create_game(game_id, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        with self.data_provider.app.app_context():
+            Game.query.update({Game.last_activity: datetime.utcnow() - timedelta(seconds=TTL_SECONDS * 2)})
+            db.session.commit()
+        game = self.data_provider.get_game_by_id(ACTIVE_GAME_ID, serialize_players=True)
+        self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=0)
+
+
+class ReapTest(BaseTest):
+    def test_reap(self):
+        # WHEN reap is called with batches smaller than the number of inactive games
+        reaped_count = GameReaper(self.data_provider, TTL_SECONDS, batch_size=2, batch_pause_seconds=0).reap()
+        # THEN every inactive game is finished as a draw
+        self.assertEquals(reaped_count, len(INACTIVE_GAME_IDS))
+        for game_id in INACTIVE_GAME_IDS:
+            game = self.data_provider.get_game_by_id(game_id)
+            self.assertEquals(game.state, GameDAO.GAME_STATE_DONE)
+            self.assertEquals(game.winner, None)
+        # THEN the recently played game is still in progress
+        self.assertEquals(self.data_provider.get_all_active_game_ids(), [ACTIVE_GAME_ID])
+
+    def test_expire_inactive_games_batch(self):
+        # WHEN expire inactive games is called
+        expired_count = self.data_provider.expire_inactive_games(datetime.utcnow() - timedelta(seconds=TTL_SECONDS), 2)
+        # THEN no more than the maximum number of games are expired
+        self.assertEquals(expired_count, 2)
+        self.assertEquals(len(self.data_provider.get_all_active_game_ids()), len(INACTIVE_GAME_IDS) - 1)
+
+    def test_move_after_expiry_rejected(self):
+        # GIVEN a game that is expired after being read for a move
+        game = self.data_provider.get_game_by_id(INACTIVE_GAME_IDS[0], serialize_players=True)
+        GameReaper(self.data_provider, TTL_SECONDS, batch_pause_seconds=0).reap()
+        # WHEN the move is persisted
+        # THEN it is rejected
+        with self.assertRaises(GameDoneError):
+            self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=0)
+        # THEN the game stays finished, without the move
+        game = self.data_provider.get_game_by_id(INACTIVE_GAME_IDS[0])
+        self.assertEquals(game.state, GameDAO.GAME_STATE_DONE)
+        self.assertEquals(game.moves, [])
+
+if __name__ == '__main__':
+    unittest.main()
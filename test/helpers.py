@@ -0,0 +1,24 @@
+import unittest
+
+from os import path
+from shutil import rmtree
+from sql_data_provider import create_database_app, db, SQLAlchemyDataProvider
+from tempfile import mkdtemp
+
+
+class SQLiteTest(unittest.TestCase):
+    """ A test case with a temporary directory for SQLite databases, removed after each test. """
+    def setUp(self):
+        self.database_dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.database_dir)
+
+    def get_database_uri(self, name):
+        return 'sqlite:///{}'.format(path.join(self.database_dir, '{}.db'.format(name)))
+
+    def create_sql_data_provider(self, name):
+        sql_data_provider = SQLAlchemyDataProvider(create_database_app(self.get_database_uri(name)))
+        with sql_data_provider.app.app_context():
+            db.create_all()
+        return sql_data_provider
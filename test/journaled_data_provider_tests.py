@@ -0,0 +1,154 @@
+import unittest
+
+from data_provider import GameDAO, MoveDAO
+from datetime import datetime, timedelta
+from journaled_data_provider import get_segment_path, get_segment_paths, JournaledDataProvider
+from json import dumps
+from mock import DEFAULT, MagicMock
+from os import path
+from test.helpers import SQLiteTest
+from time import time
+
+EXPECTED_GAME_ID = 'EXPECTED_GAME_MODEL_ID'
+EXPECTED_PLAYER_1, EXPECTED_PLAYER_2 = 'EXPECTED_PLAYER_1', 'EXPECTED_PLAYER_2'
+EXPECTED_PLAYERS = [EXPECTED_PLAYER_1, EXPECTED_PLAYER_2]
+EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
+
+
+def get_test_journal_entry(sequence, player_id=EXPECTED_PLAYER_1, column=0):
+    return {'sequence': sequence, 'game_id': EXPECTED_GAME_ID, 'player_id': player_id,
+            'move_type': MoveDAO.TYPE_MOVE, 'column': column, 'active_players': EXPECTED_PLAYERS,
+            'current_active_player_index': 0, 'winner': None, 'state': GameDAO.GAME_STATE_IN_PROGRESS,
+            'timestamp': time()}
+
+
+class BaseTest(SQLiteTest):
+    def setUp(self):
+        super(BaseTest, self).setUp()
+        self.journal_path = path.join(self.database_dir, 'moves.journal')
+        self.journal_name = path.abspath(self.journal_path)
+        self.sql_data_provider = self.create_sql_data_provider('moves')
+        self.sql_data_provider.create_game(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+
+    def write_journal(self, lines):
+        with open(get_segment_path(self.journal_path, 1), 'w') as journal_file:
+            journal_file.write(''.join(lines))
+
+
+class JournaledMoveTest(BaseTest):
+    def test_persist_move(self):
+        # GIVEN a journaled data provider
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path)
+        # WHEN moves are persisted
+        for player_id, column in (EXPECTED_PLAYER_1, 0), (EXPECTED_PLAYER_2, 1):
+            game = data_provider.get_game_for_player_with_board(EXPECTED_GAME_ID, player_id)
+            game.current_active_player_index = (game.current_active_player_index + 1) % 2
+            data_provider.persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_MOVE, column=column)
+        # THEN the moves are read back
+        game = data_provider.get_game_by_id(EXPECTED_GAME_ID, serialize_players=True)
+        self.assertEquals([(move.player_id, move.column) for move in game.moves],
+                          [(EXPECTED_PLAYER_1, 0), (EXPECTED_PLAYER_2, 1)])
+        self.assertEquals(game.active_players_list, EXPECTED_PLAYERS)
+        # THEN the moves are persisted to the database
+        data_provider.close()
+        self.assertEquals(len(self.sql_data_provider.get_game_by_id(EXPECTED_GAME_ID).moves), 2)
+        self.assertEquals(self.sql_data_provider.get_journal_checkpoint(self.journal_name), 2)
+
+    def test_persisted_segments_removed(self):
+        # GIVEN a journaled data provider starting a new segment after every move
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path, max_segment_bytes=1)
+        # WHEN moves are persisted
+        for player_id, column in (EXPECTED_PLAYER_1, 0), (EXPECTED_PLAYER_2, 1):
+            game = data_provider.get_game_by_id(EXPECTED_GAME_ID, serialize_players=True)
+            data_provider.persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_MOVE, column=column)
+        data_provider.get_game_by_id(EXPECTED_GAME_ID)
+        # THEN only the segment being written to is kept
+        self.assertEquals(get_segment_paths(self.journal_path), [get_segment_path(self.journal_path, 3)])
+        data_provider.close()
+
+    def test_second_writer_rejected(self):
+        # GIVEN a journaled data provider
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path)
+        # WHEN another journaled data provider is started with the same journal
+        # THEN it is rejected
+        with self.assertRaises(RuntimeError):
+            JournaledDataProvider(self.sql_data_provider, self.journal_path)
+        data_provider.close()
+
+    def test_persist_retried_after_error(self):
+        # GIVEN persisting journal entries fails once
+        self.sql_data_provider.persist_journal_entries = MagicMock(
+            wraps=self.sql_data_provider.persist_journal_entries, side_effect=[ValueError()] + [DEFAULT] * 10)
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path, retry_seconds=0)
+        # WHEN a move is persisted
+        game = data_provider.get_game_by_id(EXPECTED_GAME_ID, serialize_players=True)
+        data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=0)
+        # THEN the move is read back once persisting is retried
+        self.assertEquals(len(data_provider.get_game_by_id(EXPECTED_GAME_ID).moves), 1)
+        data_provider.close()
+
+    def test_wait_fails_when_not_persisted(self):
+        # GIVEN persisting journal entries always fails
+        self.sql_data_provider.persist_journal_entries = MagicMock(side_effect=ValueError())
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path, retry_seconds=0,
+                                              max_wait_seconds=0.1)
+        game = data_provider.get_game_by_id(EXPECTED_GAME_ID, serialize_players=True)
+        data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=0)
+        # WHEN the game is read
+        # THEN the read fails rather than waiting forever
+        with self.assertRaises(RuntimeError):
+            data_provider.get_game_by_id(EXPECTED_GAME_ID)
+        self.sql_data_provider.persist_journal_entries.side_effect = None
+        data_provider.close()
+
+
+class RecoverTest(BaseTest):
+    def test_recover_journal_tail(self):
+        # GIVEN a journal with entries that did not reach the database, and a partially written final entry
+        self.sql_data_provider.persist_journal_entries(self.journal_name, [get_test_journal_entry(1)])
+        self.write_journal([dumps(get_test_journal_entry(1)) + '\n',
+                            dumps(get_test_journal_entry(2, player_id=EXPECTED_PLAYER_2, column=1)) + '\n',
+                            dumps(get_test_journal_entry(3))[:20]])
+        # WHEN the journaled data provider is started
+        data_provider = JournaledDataProvider(self.sql_data_provider, self.journal_path)
+        data_provider.close()
+        # THEN only the complete entries missing from the database are persisted
+        game = self.sql_data_provider.get_game_by_id(EXPECTED_GAME_ID)
+        self.assertEquals([(move.player_id, move.column) for move in game.moves],
+                          [(EXPECTED_PLAYER_1, 0), (EXPECTED_PLAYER_2, 1)])
+        # THEN the journal starts a new empty segment and the sequence continues from the last entry
+        self.assertEquals(get_segment_paths(self.journal_path), [get_segment_path(self.journal_path, 3)])
+        self.assertEquals(path.getsize(get_segment_path(self.journal_path, 3)), 0)
+        self.assertEquals(data_provider.last_sequence, 2)
+
+    def test_persist_journal_entries_again(self):
+        # GIVEN journal entries that have been persisted
+        entries = [get_test_journal_entry(1), get_test_journal_entry(2, player_id=EXPECTED_PLAYER_2)]
+        self.sql_data_provider.persist_journal_entries(self.journal_name, entries)
+        # WHEN the entries are persisted again
+        self.sql_data_provider.persist_journal_entries(self.journal_name, entries)
+        # THEN the moves are only persisted once
+        self.assertEquals(len(self.sql_data_provider.get_game_by_id(EXPECTED_GAME_ID).moves), 2)
+
+    def test_persist_journal_entries_deleted_game(self):
+        # GIVEN a journal entry for a game that has since been deleted
+        entries = [get_test_journal_entry(1)]
+        self.sql_data_provider.delete_game(EXPECTED_GAME_ID)
+        # WHEN the entries are persisted
+        self.sql_data_provider.persist_journal_entries(self.journal_name, entries)
+        # THEN the entry is skipped
+        self.assertEquals(self.sql_data_provider.get_journal_checkpoint(self.journal_name), 1)
+
+    def test_persist_journal_entries_expired_game(self):
+        # GIVEN a journal entry for a game that has since been expired
+        entries = [get_test_journal_entry(1)]
+        self.sql_data_provider.expire_inactive_games(datetime.utcnow() + timedelta(seconds=1), 1)
+        # WHEN the entries are persisted
+        self.sql_data_provider.persist_journal_entries(self.journal_name, entries)
+        # THEN the entry is skipped, leaving the game finished
+        game = self.sql_data_provider.get_game_by_id(EXPECTED_GAME_ID)
+        self.assertEquals((game.state, len(game.moves)), (GameDAO.GAME_STATE_DONE, 0))
+        self.assertEquals(self.sql_data_provider.get_journal_checkpoint(self.journal_name), 1)
+
+if __name__ == '__main__':
+    unittest.main()
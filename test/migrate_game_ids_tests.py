@@ -0,0 +1,124 @@
+import unittest
+
+from data_provider import GameExistsError, MoveDAO
+from datetime import datetime
+from game_ids import decode_game_id
+from migrate_game_ids import migrate_legacy_games
+from mock import MagicMock, patch
+from pickle import dumps
+from sql_data_provider import Game
+from sqlalchemy import create_engine, text
+from test.helpers import SQLiteTest
+
+EXPECTED_GAME_ID = '8d0dba4e-5b56-4a3a-9b3c-3d1c2b8a9f10'
+EXPECTED_EMPTY_GAME_ID = '2f7c1e7a-0c59-4b43-a1f4-64c1d3f0e5b2'
+EXPECTED_PLAYER_1, EXPECTED_PLAYER_2 = 'EXPECTED_PLAYER_1', 'EXPECTED_PLAYER_2'
+EXPECTED_PLAYERS = [EXPECTED_PLAYER_1, EXPECTED_PLAYER_2]
+EXPECTED_PUB_DATES = [datetime(2018, 3, 1, 12, 0, 0), datetime(2018, 3, 1, 12, 0, 5)]
+
+LEGACY_TABLES = ['CREATE TABLE game (id VARCHAR NOT NULL PRIMARY KEY, columns INTEGER NOT NULL, rows INTEGER NOT NULL, '
+                 'initial_players VARCHAR NOT NULL, active_players VARCHAR NOT NULL, '
+                 'current_active_player_index INTEGER NOT NULL, state INTEGER NOT NULL, winner VARCHAR)',
+                 'CREATE TABLE move (id INTEGER NOT NULL PRIMARY KEY, player_id VARCHAR NOT NULL, '
+                 'pub_date DATETIME NOT NULL, game_id VARCHAR NOT NULL REFERENCES game (id), '
+                 'move_type VARCHAR NOT NULL, "column" INTEGER)']
+
+
+class MigrateLegacyGamesTest(SQLiteTest):
+    def setUp(self):
+        super(MigrateLegacyGamesTest, self).setUp()
+        # GIVEN a database with string game IDs, holding a game with moves and a game without moves
+        self.legacy_engine = create_engine(self.get_database_uri('legacy'))
+        with self.legacy_engine.begin() as connection:
+            for statement in LEGACY_TABLES:
+                connection.execute(text(statement))
+            for game_id in EXPECTED_GAME_ID, EXPECTED_EMPTY_GAME_ID:
+                connection.execute(text('INSERT INTO game VALUES (:id, 4, 4, :players, :players, 0, 0, NULL)'),
+                                   {'id': game_id, 'players': dumps(EXPECTED_PLAYERS)})
+            for move_id, player_id, column in (2, EXPECTED_PLAYER_2, 1), (1, EXPECTED_PLAYER_1, 0):
+                connection.execute(text("INSERT INTO move VALUES (:id, :player_id, :pub_date, :game_id, 'MOVE', "
+                                        ":column)"),
+                                   {'id': move_id, 'player_id': player_id, 'pub_date': EXPECTED_PUB_DATES[move_id - 1],
+                                    'game_id': EXPECTED_GAME_ID, 'column': column})
+        # GIVEN a database with compact game IDs
+        self.data_provider = self.create_sql_data_provider('games')
+
+    def tearDown(self):
+        self.legacy_engine.dispose()
+        super(MigrateLegacyGamesTest, self).tearDown()
+
+    def test_migrate_legacy_games(self):
+        # WHEN the legacy games are migrated, in batches smaller than the number of games
+        migrated_count = migrate_legacy_games(self.legacy_engine, self.data_provider.app, batch_size=1)
+        # THEN every game is migrated
+        self.assertEquals(migrated_count, 2)
+        # THEN the games are still found by their legacy IDs, with their moves in order
+        game = self.data_provider.get_game_for_player_with_board(EXPECTED_GAME_ID, EXPECTED_PLAYER_1)
+        self.assertEquals(game.id, EXPECTED_GAME_ID)
+        self.assertEquals([(move.player_id, move.move_type, move.column) for move in game.moves],
+                          [(EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, 0), (EXPECTED_PLAYER_2, MoveDAO.TYPE_MOVE, 1)])
+        self.assertEquals(game.board[0][3], EXPECTED_PLAYER_1)
+        self.assertIsNotNone(self.data_provider.get_game_by_id(EXPECTED_EMPTY_GAME_ID))
+        self.assertEquals(sorted(self.data_provider.get_all_active_game_ids()),
+                          sorted([EXPECTED_GAME_ID, EXPECTED_EMPTY_GAME_ID]))
+        # THEN the games are stored with compact IDs, and their last activity
+        with self.data_provider.app.app_context():
+            migrated_game = Game.query.filter_by(legacy_id=EXPECTED_GAME_ID).first()
+            self.assertEquals(migrated_game.last_activity, EXPECTED_PUB_DATES[1])
+            self.assertEquals([move.game_id for move in migrated_game.moves], [migrated_game.id] * 2)
+        # THEN migrating again migrates nothing
+        self.assertEquals(migrate_legacy_games(self.legacy_engine, self.data_provider.app), 0)
+
+    def test_migrate_many_empty_games(self):
+        # GIVEN more games without moves than could be given distinct random bits in one millisecond
+        empty_game_ids = ['EMPTY_GAME_ID_{:04d}'.format(index) for index in range(500)]
+        with self.legacy_engine.begin() as connection:
+            connection.execute(text('INSERT INTO game VALUES (:id, 4, 4, :players, :players, 0, 0, NULL)'),
+                               [{'id': game_id, 'players': dumps(EXPECTED_PLAYERS)} for game_id in empty_game_ids])
+        # WHEN the legacy games are migrated in a single batch
+        migrated_count = migrate_legacy_games(self.legacy_engine, self.data_provider.app)
+        # THEN every game is migrated, with the empty games in legacy ID order
+        self.assertEquals(migrated_count, len(empty_game_ids) + 2)
+        with self.data_provider.app.app_context():
+            migrated_ids = [legacy_id for legacy_id, in Game.query.filter(Game.legacy_id.in_(empty_game_ids))
+                            .order_by(Game.id).with_entities(Game.legacy_id)]
+        self.assertEquals(migrated_ids, empty_game_ids)
+
+
+class CompactGameIdTest(SQLiteTest):
+    def setUp(self):
+        super(CompactGameIdTest, self).setUp()
+        self.data_provider = self.create_sql_data_provider('games')
+
+    def test_create_game_compact_id(self):
+        # WHEN a game is created with a compact ID
+        game_id = '10000000000b1'
+        self.data_provider.create_game(game_id, 4, 4, EXPECTED_PLAYERS)
+        # THEN the game is stored with the integer ID, and found by the compact ID
+        with self.data_provider.app.app_context():
+            self.assertIsNone(Game.query.filter_by(id=decode_game_id(game_id)).first().legacy_id)
+        self.assertEquals(self.data_provider.get_game_by_id(game_id).id, game_id)
+        self.assertEquals(list(self.data_provider.get_move_rows([game_id])), [(game_id, None, None, None)])
+
+    def test_create_game_existing_id(self):
+        # GIVEN a game with a compact ID
+        game_id = '10000000000b1'
+        self.data_provider.create_game(game_id, 4, 4, EXPECTED_PLAYERS)
+        # WHEN a game is created with the same ID
+        # THEN it is rejected
+        with self.assertRaises(GameExistsError):
+            self.data_provider.create_game(game_id, 4, 4, EXPECTED_PLAYERS)
+
+    def test_create_game_legacy_id_collision(self):
+        # GIVEN the compact ID first generated for a game created with a legacy ID is already in use
+        self.data_provider.create_game('10000000000b1', 4, 4, EXPECTED_PLAYERS)
+        generated_ids = [decode_game_id('10000000000b1'), decode_game_id('10000000000b2')]
+        with patch('sql_data_provider.generate_game_id', MagicMock(side_effect=generated_ids)):
+            # WHEN the game is created
+            self.data_provider.create_game(EXPECTED_GAME_ID, 4, 4, EXPECTED_PLAYERS)
+        # THEN it is stored with a newly generated compact ID
+        with self.data_provider.app.app_context():
+            self.assertEquals(Game.query.filter_by(legacy_id=EXPECTED_GAME_ID).first().id, generated_ids[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+from data_provider import MoveDAO
+from mock import MagicMock
+from replicated_data_provider import ReplicatedDataProvider
+from test.helpers import SQLiteTest
+from time import sleep, time
+
+EXPECTED_GAME_ID = 'EXPECTED_GAME_MODEL_ID'
+EXPECTED_PLAYER_1, EXPECTED_PLAYER_2 = 'EXPECTED_PLAYER_1', 'EXPECTED_PLAYER_2'
+EXPECTED_PLAYERS = [EXPECTED_PLAYER_1, EXPECTED_PLAYER_2]
+EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
+
+
+class BaseTest(SQLiteTest):
+    def setUp(self):
+        super(BaseTest, self).setUp()
+        self.primary = self.create_sql_data_provider('primary')
+        self.replica = self.create_sql_data_provider('replica')
+        self.data_provider = ReplicatedDataProvider(self.primary, [self.replica], max_lag_moves=0)
+        # GIVEN a game that has been replicated
+        for sql_data_provider in self.primary, self.replica:
+            sql_data_provider.create_game(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+
+    def persist_move(self, sql_data_provider, player_id, column):
+        game = sql_data_provider.get_game_by_id(EXPECTED_GAME_ID, serialize_players=True)
+        sql_data_provider.persist_new_move_and_game_state(game, player_id, MoveDAO.TYPE_MOVE, column=column)
+
+
+class ReadRoutingTest(BaseTest):
+    def test_read_from_replica(self):
+        # GIVEN a game that only exists on the replica
+        self.replica.create_game('REPLICA_ONLY_GAME_ID', EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        # WHEN get game by id is called
+        result = self.data_provider.get_game_by_id('REPLICA_ONLY_GAME_ID')
+        # THEN the game is read from the replica
+        self.assertIsNotNone(result)
+        # THEN the active games are read from the replica
+        self.assertEquals(sorted(self.data_provider.get_all_active_game_ids()),
+                          sorted([EXPECTED_GAME_ID, 'REPLICA_ONLY_GAME_ID']))
+
+    def test_read_your_writes(self):
+        # GIVEN a move is written that has not reached the replica
+        self.persist_move(self.data_provider, EXPECTED_PLAYER_1, 0)
+        # WHEN get game by id is called
+        result = self.data_provider.get_game_by_id(EXPECTED_GAME_ID)
+        # THEN the game includes the move
+        self.assertEquals(len(result.moves), 1)
+
+    def test_min_move_count(self):
+        # GIVEN a move is written by another process that has not reached the replica
+        self.persist_move(self.primary, EXPECTED_PLAYER_1, 0)
+        # WHEN get game by id is called for the written move
+        result = self.data_provider.get_game_by_id(EXPECTED_GAME_ID, min_move_count=1)
+        # THEN the game includes the move
+        self.assertEquals(len(result.moves), 1)
+
+    def test_write_to_primary(self):
+        # WHEN a move is persisted
+        self.persist_move(self.data_provider, EXPECTED_PLAYER_1, 0)
+        # THEN the move is only written to the primary
+        self.assertEquals(len(self.primary.get_game_by_id(EXPECTED_GAME_ID).moves), 1)
+        self.assertEquals(len(self.replica.get_game_by_id(EXPECTED_GAME_ID).moves), 0)
+
+
+class ReplicaLagTest(BaseTest):
+    def test_lagging_replica_ejected_and_restored(self):
+        # GIVEN a replica that is missing a move
+        self.persist_move(self.primary, EXPECTED_PLAYER_1, 0)
+        # WHEN replica lag is checked
+        replica_lags = self.data_provider.check_replica_lag()
+        # THEN the replica is ejected
+        self.assertEquals(replica_lags, [1])
+        self.assertIsNone(self.data_provider.choose_replica())
+        # GIVEN the replica catches up
+        self.persist_move(self.replica, EXPECTED_PLAYER_1, 0)
+        # WHEN replica lag is checked
+        replica_lags = self.data_provider.check_replica_lag()
+        # THEN the replica is restored
+        self.assertEquals(replica_lags, [0])
+        self.assertIs(self.data_provider.choose_replica(), self.replica)
+
+    def test_lag_monitor_continues_after_error(self):
+        # GIVEN checking replica lag fails once
+        self.data_provider.check_replica_lag = MagicMock(side_effect=[ValueError()] + [[0]] * 100)
+        # WHEN the lag monitor is started
+        self.data_provider.start_lag_monitor(interval_seconds=0.01)
+        wait_until = time() + 5
+        while self.data_provider.check_replica_lag.call_count < 2 and time() < wait_until:
+            sleep(0.01)
+        self.data_provider.stop_lag_monitor()
+        # THEN replica lag is still checked after the error
+        self.assertGreaterEqual(self.data_provider.check_replica_lag.call_count, 2)
+
+
+class MultipleReplicaTest(BaseTest):
+    def setUp(self):
+        super(MultipleReplicaTest, self).setUp()
+        self.lagging_replica = self.create_sql_data_provider('lagging_replica')
+        self.lagging_replica.create_game(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        self.data_provider = ReplicatedDataProvider(self.primary, [self.replica, self.lagging_replica],
+                                                    max_lag_moves=100)
+        # GIVEN a move is written that has only reached one of the replicas
+        self.persist_move(self.data_provider, EXPECTED_PLAYER_1, 0)
+        self.persist_move(self.replica, EXPECTED_PLAYER_1, 0)
+
+    def test_read_your_writes_with_lagging_replica(self):
+        # WHEN get game by id is called repeatedly
+        results = [self.data_provider.get_game_by_id(EXPECTED_GAME_ID) for _ in range(40)]
+        # THEN every result includes the move
+        self.assertEquals([len(game.moves) for game in results], [1] * 40)
+
+    def test_written_move_count_kept_while_replica_lags(self):
+        # WHEN replica lag is checked while a replica receiving reads lags
+        self.assertEquals(self.data_provider.check_replica_lag(), [0, 1])
+        # THEN reads still include the move
+        results = [self.data_provider.get_game_by_id(EXPECTED_GAME_ID) for _ in range(40)]
+        self.assertEquals([len(game.moves) for game in results], [1] * 40)
+        # GIVEN the lagging replica catches up
+        self.persist_move(self.lagging_replica, EXPECTED_PLAYER_1, 0)
+        # WHEN replica lag is checked
+        self.assertEquals(self.data_provider.check_replica_lag(), [0, 0])
+        # THEN the written move count is forgotten
+        self.assertEquals(dict(self.data_provider.written_move_counts), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from data_provider import GameDAO, MoveDAO
+from sharded_data_provider import ShardedDataProvider
+from sql_data_provider import db
+from test.helpers import SQLiteTest
+
+EXPECTED_PLAYER_1, EXPECTED_PLAYER_2 = 'EXPECTED_PLAYER_1', 'EXPECTED_PLAYER_2'
+EXPECTED_PLAYERS = [EXPECTED_PLAYER_1, EXPECTED_PLAYER_2]
+EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
+EXPECTED_GAME_IDS = ['EXPECTED_GAME_ID_{}'.format(index) for index in range(20)]
+
+
+class BaseTest(SQLiteTest):
+    def setUp(self):
+        super(BaseTest, self).setUp()
+        self.data_provider = self.create_data_provider(['shard0', 'shard1', 'shard2'])
+
+    def create_data_provider(self, shard_names):
+        database_uris = {name: self.get_database_uri(name) for name in shard_names}
+        data_provider = ShardedDataProvider.from_database_uris(database_uris)
+        for shard in data_provider.shards.values():
+            with shard.app.app_context():
+                db.create_all()
+        return data_provider
+
+
+class ShardRoutingTest(BaseTest):
+    def test_create_game_stored_on_owner_shard(self):
+        # WHEN create game is called
+        self.data_provider.create_game(EXPECTED_GAME_IDS[0], EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        # THEN the game is only stored on the shard that owns it
+        owner_name = self.data_provider.get_shard_name(EXPECTED_GAME_IDS[0])
+        for shard_name, shard in self.data_provider.shards.items():
+            self.assertEquals(shard.get_game_by_id(EXPECTED_GAME_IDS[0]) is not None, shard_name == owner_name)
+
+    def test_games_spread_across_shards(self):
+        # WHEN the owners of many games are found
+        owner_names = set(self.data_provider.get_shard_name(game_id) for game_id in EXPECTED_GAME_IDS)
+        # THEN every shard owns games
+        self.assertEquals(owner_names, set(self.data_provider.shards))
+
+    def test_get_all_active_game_ids(self):
+        # GIVEN in-progress and done games on every shard
+        for game_id in EXPECTED_GAME_IDS:
+            self.data_provider.create_game(game_id, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        done_game = self.data_provider.get_game_by_id(EXPECTED_GAME_IDS[0], serialize_players=True)
+        done_game.state = GameDAO.GAME_STATE_DONE
+        self.data_provider.persist_new_move_and_game_state(done_game, EXPECTED_PLAYER_1, MoveDAO.TYPE_QUIT)
+        # WHEN get all game ids is called
+        result = self.data_provider.get_all_active_game_ids()
+        # THEN the result contains the in-progress games of every shard
+        self.assertEquals(sorted(result), sorted(EXPECTED_GAME_IDS[1:]))
+
+    def test_get_move_rows(self):
+        # GIVEN games with and without moves on every shard
+        for game_id in EXPECTED_GAME_IDS:
+            self.data_provider.create_game(game_id, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+        game = self.data_provider.get_game_by_id(EXPECTED_GAME_IDS[0], serialize_players=True)
+        self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=3)
+        self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_2, MoveDAO.TYPE_QUIT)
+        # WHEN get move rows is called
+        result = list(self.data_provider.get_move_rows(EXPECTED_GAME_IDS[:3] + ['foo']))
+        # THEN a row is provided per move, or per game without moves
+        self.assertEquals(sorted(result), sorted([(EXPECTED_GAME_IDS[0], EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, 3),
+                                                  (EXPECTED_GAME_IDS[0], EXPECTED_PLAYER_2, MoveDAO.TYPE_QUIT, None),
+                                                  (EXPECTED_GAME_IDS[1], None, None, None),
+                                                  (EXPECTED_GAME_IDS[2], None, None, None)]))
+
+
+class RebalanceTest(BaseTest):
+    def test_rebalance_after_adding_shard(self):
+        # GIVEN games with moves stored across the shards
+        for game_id in EXPECTED_GAME_IDS:
+            self.data_provider.create_game(game_id, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
+            game = self.data_provider.get_game_by_id(game_id, serialize_players=True)
+            self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_1, MoveDAO.TYPE_MOVE, column=0)
+            self.data_provider.persist_new_move_and_game_state(game, EXPECTED_PLAYER_2, MoveDAO.TYPE_MOVE, column=1)
+        # GIVEN a shard is added
+        data_provider = self.create_data_provider(['shard0', 'shard1', 'shard2', 'shard3'])
+        expected_moved_count = sum(1 for game_id in EXPECTED_GAME_IDS if data_provider.get_shard_name(game_id) == 'shard3')
+        # WHEN rebalance is called
+        moved_count = data_provider.rebalance()
+        # THEN only the games owned by the new shard are moved
+        self.assertEquals(moved_count, expected_moved_count)
+        self.assertTrue(moved_count > 0)
+        # THEN every game and its moves are found on its owner shard
+        for game_id in EXPECTED_GAME_IDS:
+            game = data_provider.get_game_by_id(game_id)
+            self.assertEquals([(move.player_id, move.column) for move in game.moves],
+                              [(EXPECTED_PLAYER_1, 0), (EXPECTED_PLAYER_2, 1)])
+        self.assertEquals(sorted(data_provider.get_all_active_game_ids()), sorted(EXPECTED_GAME_IDS))
+        # THEN running rebalance again moves nothing
+        self.assertEquals(data_provider.rebalance(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 
 from app import flask_app
 from data_provider import GameDAO
+from game_ids import generate_game_id
 from pickle import dumps, loads
 from sql_data_provider import SQLAlchemyDataProvider, Game, db
 
@@ -13,7 +14,7 @@ EXPECTED_COLUMNS, EXPECTED_ROWS = 4, 4
 
 def get_test_game_model(game_id=EXPECTED_GAME_ID, columns=4, rows=4, state=0, winner=None,
                         initial_players=EXPECTED_PLAYERS, active_players=EXPECTED_PLAYERS):
-    return Game(id=game_id, columns=columns, rows=rows, state=state, winner=winner,
+    return Game(id=generate_game_id(), legacy_id=game_id, columns=columns, rows=rows, state=state, winner=winner,
                 initial_players=dumps(initial_players), active_players=dumps(active_players))
 
 
@@ -56,7 +57,7 @@ class GetAllGameIdsTest(BaseTest):
         self.data_provider.create_game(EXPECTED_GAME_ID, EXPECTED_COLUMNS, EXPECTED_ROWS, EXPECTED_PLAYERS)
         # THEN the data is saved
         with self.app.app_context():
-            game = Game.query.filter_by(id=EXPECTED_GAME_ID).first()
+            game = Game.query.filter_by(legacy_id=EXPECTED_GAME_ID).first()
             self.assertEquals(game.columns, EXPECTED_COLUMNS)
             self.assertEquals(game.rows, EXPECTED_ROWS)
             self.assertEquals(loads(game.initial_players), EXPECTED_PLAYERS)